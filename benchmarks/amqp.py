@@ -0,0 +1,361 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Callable, Deque, Dict, List, Set, Tuple, Union
+
+import pika
+import pika.exceptions
+import pika.frame
+import pika.spec
+
+from common.connection import ConnectionFactory
+
+
+def topic_matches(pattern: str, routing_key: str) -> bool:
+    """Match a routing key against a topic binding key, '*' is one word and '#' zero or more.
+    """
+    def match(words: List[str], keys: List[str]) -> bool:
+        if not words:
+            return not keys
+        if words[0] == '#':
+            return any(match(words[1:], keys[index:]) for index in range(len(keys) + 1))
+        if not keys:
+            return False
+        return (words[0] == '*' or words[0] == keys[0]) and match(words[1:], keys[1:])
+
+    return match(pattern.split('.'), routing_key.split('.'))
+
+
+def method_frame(method: pika.amqp_object.Method) -> pika.frame.Method:
+    return pika.frame.Method(1, method)
+
+
+class InMemoryBroker():
+    """Single process AMQP stand-in: exchanges, bindings and FIFO queues, shared by threads.
+    Routing follows RabbitMQ's fanout, direct and topic semantics, nothing else is emulated.
+    Every delivery's callback duration is recorded by queue.
+    """
+    def __init__(self):
+        self.exchanges: Dict[str, str] = {'': 'direct'}
+        self.bindings: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+        self.queues: Dict[str, Deque[Tuple[str, pika.BasicProperties, bytes]]] = {}
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.published = 0
+        self.unroutable = 0
+        self.in_flight = 0
+        self.consuming: Set[str] = set()
+        # notified on every publish and processed delivery
+        self.condition = threading.Condition()
+        self._names = itertools.count(1)
+
+    def exchange_declare(self, exchange: str, exchange_type: str):
+        with self.condition:
+            self.exchanges.setdefault(exchange, exchange_type)
+
+    def queue_declare(self, queue: str = '') -> str:
+        with self.condition:
+            queue = queue or f'amq.gen-{next(self._names)}'
+            self.queues.setdefault(queue, deque())
+            return queue
+
+    def queue_bind(self, exchange: str, queue: str, routing_key: str):
+        with self.condition:
+            if (routing_key, queue) not in self.bindings[exchange]:
+                self.bindings[exchange].append((routing_key, queue))
+
+    def publish(self, exchange: str, routing_key: str, body: Union[str, bytes], properties: pika.BasicProperties):
+        body = body.encode('UTF-8') if isinstance(body, str) else body
+        with self.condition:
+            exchange_type = self.exchanges[exchange]
+            if exchange == '':
+                targets = [routing_key] if routing_key in self.queues else []
+            elif exchange_type == 'fanout':
+                targets = [queue for _, queue in self.bindings[exchange]]
+            elif exchange_type == 'topic':
+                targets = [queue for key, queue in self.bindings[exchange] if topic_matches(key, routing_key)]
+            else:
+                targets = [queue for key, queue in self.bindings[exchange] if key == routing_key]
+
+            for queue in dict.fromkeys(targets):
+                self.queues[queue].append((routing_key, properties, body))
+            self.published += 1
+            self.unroutable += not targets
+            self.condition.notify_all()
+
+    def take(self, queue: str) -> Union[Tuple[str, pika.BasicProperties, bytes], None]:
+        """Pop a queue's next message, counted in flight until done() is called.
+        """
+        with self.condition:
+            messages = self.queues[queue]
+            if not messages:
+                return None
+            self.in_flight += 1
+            return messages.popleft()
+
+    def done(self, queue: str, latency: float):
+        with self.condition:
+            self.in_flight -= 1
+            self.latencies[queue].append(latency)
+            self.condition.notify_all()
+
+    def drained(self, queues) -> bool:
+        """Whether the queues are empty and none of their messages is being processed, hold the condition.
+        """
+        return self.in_flight == 0 and not any(self.queues.get(queue) for queue in queues)
+
+    def consume(self, queues, consuming: bool):
+        """Record whether the queues are being consumed.
+        """
+        with self.condition:
+            if consuming:
+                self.consuming.update(queues)
+            else:
+                self.consuming.difference_update(queues)
+            self.condition.notify_all()
+
+    def depth(self) -> int:
+        with self.condition:
+            return sum(len(messages) for messages in self.queues.values())
+
+
+class BlockingChannelStandIn():
+    """The subset of pika's BlockingChannel used by the consumer and the cache invalidator.
+    start_consuming delivers round-robin across consumed queues, waiting for messages,
+    until stop_consuming is called.
+    """
+    def __init__(self, connection: 'BlockingConnectionStandIn'):
+        self.connection = connection
+        self.broker = connection.broker
+        self.is_open = True
+        self.acked = 0
+        self._consumers: Dict[str, Callable] = {}
+        self._delivery_tags = itertools.count(1)
+        self._stopping = False
+
+    def basic_qos(self, prefetch_count: int):
+        del prefetch_count
+
+    def exchange_declare(self, exchange: str, exchange_type: str, durable: bool = True):
+        del durable
+        self.broker.exchange_declare(exchange, exchange_type)
+
+    def queue_declare(self, queue: str = '', durable: bool = True, **kwargs) -> pika.frame.Method:
+        del durable, kwargs
+        return method_frame(pika.spec.Queue.DeclareOk(queue=self.broker.queue_declare(queue)))
+
+    def queue_bind(self, exchange: str, queue: str, routing_key: Union[str, None] = None):
+        self.broker.queue_bind(exchange, queue, routing_key or queue)
+
+    def basic_publish(self, exchange: str, routing_key: str, body, properties=None):
+        self.broker.publish(exchange, routing_key, body, properties or pika.BasicProperties())
+
+    def basic_consume(self, queue: str, on_message_callback: Callable, auto_ack: bool = False):
+        del auto_ack
+        self._consumers[queue] = on_message_callback
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        del delivery_tag, multiple
+        self.acked += 1
+
+    def _deliver(self) -> bool:
+        delivered = False
+        for queue, callback in list(self._consumers.items()):
+            message = self.broker.take(queue)
+            if message is None:
+                continue
+            routing_key, properties, body = message
+            method = pika.spec.Basic.Deliver(delivery_tag=next(self._delivery_tags), routing_key=routing_key)
+            start = time.perf_counter()
+            try:
+                callback(self, method, properties, body)
+            finally:
+                self.broker.done(queue, time.perf_counter() - start)
+            delivered = True
+        return delivered
+
+    def start_consuming(self):
+        self._stopping = False
+        self.broker.consume(self._consumers, True)
+        try:
+            while not self._stopping:
+                self.connection.process_data_events()
+                if self._stopping or self._deliver():
+                    continue
+                with self.broker.condition:
+                    if not any(self.broker.queues[queue] for queue in self._consumers):
+                        self.broker.condition.wait(self.connection.next_timeout(0.05))
+        finally:
+            self.broker.consume(self._consumers, False)
+
+    def stop_consuming(self):
+        self._stopping = True
+        with self.broker.condition:
+            self.broker.condition.notify_all()
+
+    def close(self):
+        self.is_open = False
+
+
+class BlockingConnectionStandIn():
+    """The subset of pika's BlockingConnection used by the consumer and the cache invalidator.
+    Timers and thread-safe callbacks run from start_consuming and process_data_events, like pika's.
+    """
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+        self.is_open = True
+        self._timers: List[Tuple[float, int]] = []
+        self._callbacks: Dict[int, Callable] = {}
+        self._timer_ids = itertools.count(1)
+        self._threadsafe: Deque[Callable] = deque()
+
+    def channel(self) -> BlockingChannelStandIn:
+        return BlockingChannelStandIn(self)
+
+    def call_later(self, delay: float, callback: Callable) -> int:
+        timer = next(self._timer_ids)
+        self._callbacks[timer] = callback
+        heapq.heappush(self._timers, (time.monotonic() + delay, timer))
+        return timer
+
+    def remove_timeout(self, timer: int):
+        self._callbacks.pop(timer, None)
+
+    def next_timeout(self, limit: float) -> float:
+        if not self._timers:
+            return limit
+        return max(0.0, min(limit, self._timers[0][0] - time.monotonic()))
+
+    def add_callback_threadsafe(self, callback: Callable):
+        if not self.is_open:
+            raise pika.exceptions.ConnectionWrongStateError('BlockingConnection.add_callback_threadsafe() called on closed or closing connection.')
+        self._threadsafe.append(callback)
+        with self.broker.condition:
+            self.broker.condition.notify_all()
+
+    def process_data_events(self, time_limit: float = 0):
+        del time_limit
+        while self._threadsafe:
+            self._threadsafe.popleft()()
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, timer = heapq.heappop(self._timers)
+            callback = self._callbacks.pop(timer, None)
+            if callback is not None:
+                callback()
+
+    def close(self):
+        self.is_open = False
+
+
+class AsyncioChannelStandIn():
+    """The subset of pika's asyncio Channel used by the producer.
+    Every method completes through its callback on the next loop iteration,
+    and publishes are acked the same way once confirms are enabled.
+    """
+    def __init__(self, connection: 'AsyncioConnectionStandIn'):
+        self.broker = connection.broker
+        self.loop = connection.loop
+        self.is_open = True
+        self._on_close: List[Callable] = []
+        self._on_confirm: Union[Callable, None] = None
+        self._delivery_tags = itertools.count(1)
+
+    def add_on_close_callback(self, callback: Callable):
+        self._on_close.append(callback)
+
+    def confirm_delivery(self, ack_nack_callback: Callable, callback: Callable):
+        self._on_confirm = ack_nack_callback
+        self.loop.call_soon(callback, method_frame(pika.spec.Confirm.SelectOk()))
+
+    def exchange_declare(self, callback: Callable, exchange: str, exchange_type: str, durable: bool = True):
+        del durable
+        self.broker.exchange_declare(exchange, exchange_type)
+        self.loop.call_soon(callback, method_frame(pika.spec.Exchange.DeclareOk()))
+
+    def queue_declare(self, callback: Callable, queue: str = '', durable: bool = True, arguments=None, **kwargs):
+        del durable, arguments, kwargs
+        queue = self.broker.queue_declare(queue)
+        self.loop.call_soon(callback, method_frame(pika.spec.Queue.DeclareOk(queue=queue)))
+
+    def queue_bind(self, callback: Callable, exchange: str, queue: str, routing_key: Union[str, None] = None):
+        self.broker.queue_bind(exchange, queue, routing_key or queue)
+        self.loop.call_soon(callback, method_frame(pika.spec.Queue.BindOk()))
+
+    def basic_publish(self, exchange: str, routing_key: str, body, properties=None):
+        if not self.is_open:
+            raise pika.exceptions.ChannelWrongStateError('Channel is closed.')
+        self.broker.publish(exchange, routing_key, body, properties or pika.BasicProperties())
+        if self._on_confirm is not None:
+            ack = pika.spec.Basic.Ack(delivery_tag=next(self._delivery_tags), multiple=False)
+            self.loop.call_soon(self._on_confirm, method_frame(ack))
+
+    def _closed(self, exception: BaseException):
+        if not self.is_open:
+            return
+        self.is_open = False
+        for callback in self._on_close:
+            self.loop.call_soon(callback, self, exception)
+
+
+class AsyncioConnectionStandIn():
+    """The subset of pika's AsyncioConnection used by the producer, opened on the next loop iteration.
+    """
+    def __init__(
+        self,
+        broker: InMemoryBroker,
+        on_open_callback: Callable,
+        on_open_error_callback: Union[Callable, None] = None,
+        on_close_callback: Union[Callable, None] = None,
+        custom_ioloop: Union[asyncio.AbstractEventLoop, None] = None,
+    ):
+        del on_open_error_callback
+        self.broker = broker
+        self.loop = custom_ioloop or asyncio.get_event_loop()
+        self.is_open = True
+        self.is_closing = False
+        self.is_closed = False
+        self._channels: List[AsyncioChannelStandIn] = []
+        self._on_close: List[Callable] = [on_close_callback] if on_close_callback is not None else []
+        self.loop.call_soon(on_open_callback, self)
+
+    def channel(self, on_open_callback: Callable) -> AsyncioChannelStandIn:
+        channel = AsyncioChannelStandIn(self)
+        self._channels.append(channel)
+        self.loop.call_soon(on_open_callback, channel)
+        return channel
+
+    def add_on_close_callback(self, callback: Callable):
+        self._on_close.append(callback)
+
+    def close(self, reply_code: int = 200, reply_text: str = 'Normal shutdown'):
+        if not self.is_open:
+            return
+        self.is_open = False
+        exception = pika.exceptions.ConnectionClosedByClient(reply_code, reply_text)
+        for channel in self._channels:
+            channel._closed(exception)
+
+        def closed():
+            self.is_closed = True
+            for callback in self._on_close:
+                callback(self, exception)
+
+        self.loop.call_soon(closed)
+
+
+class InMemoryConnectionFactory(ConnectionFactory):
+    """Connects both services to an in-memory broker, installed with set_connection_factory.
+    """
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+
+    def blocking(self, parameters: pika.ConnectionParameters) -> BlockingConnectionStandIn:
+        del parameters
+        return BlockingConnectionStandIn(self.broker)
+
+    def asyncio(self, parameters: pika.ConnectionParameters, **callbacks) -> AsyncioConnectionStandIn:
+        del parameters
+        return AsyncioConnectionStandIn(self.broker, **callbacks)
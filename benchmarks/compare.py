@@ -0,0 +1,55 @@
+"""Compare two benchmark result files, e.g. the base and head of a change.
+
+    python benchmarks/compare.py base.json head.json --threshold 10
+"""
+import argparse
+import json
+import sys
+from typing import Dict
+
+
+def load(path: str) -> Dict[str, dict]:
+    with open(path) as file:
+        report = json.load(file)
+    return {result['name']: result for result in report['results']}
+
+
+def change(base: float, head: float) -> float:
+    """Relative change in percent, positive when head is larger.
+    """
+    return (head - base) / base * 100 if base else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument(
+        '--threshold', type=float, default=None,
+        help='exit with status 1 if throughput drops or p99 grows by more than this percentage',
+    )
+    args = parser.parse_args()
+
+    base, head = load(args.base), load(args.head)
+    regressions = []
+    print(f'{"scenario":<14}{"throughput":>24}{"change":>9}{"p50 ms":>20}{"p99 ms":>20}{"change":>9}')
+    for name in [name for name in base if name in head]:
+        old, new = base[name], head[name]
+        throughput = change(old['throughput'], new['throughput'])
+        p99 = change(old['p99_ms'], new['p99_ms'])
+        print(
+            f'{name:<14}'
+            f'{old["throughput"]:>11.1f} -> {new["throughput"]:>9.1f}{throughput:>+8.1f}%'
+            f'{old["p50_ms"]:>9.2f} -> {new["p50_ms"]:>7.2f}'
+            f'{old["p99_ms"]:>9.2f} -> {new["p99_ms"]:>7.2f}{p99:>+8.1f}%'
+        )
+        if args.threshold is not None and (throughput < -args.threshold or p99 > args.threshold):
+            regressions.append(name)
+
+    if regressions:
+        print(f'Regressions above {args.threshold}%: {", ".join(sorted(regressions))}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+"""Offline end-to-end benchmarks of the producer API, outbox relay and consumer.
+
+SQLite replaces PostgreSQL and an in-memory broker replaces RabbitMQ, so results
+are comparable between commits on the same machine, not with production.
+
+    python benchmarks/run.py --requests 2000 --concurrency 32 --output results.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = (
+    'create_user',
+    'token',
+    'create_order',
+    'get_user',
+    'get_order',
+    'list_users',
+    'list_orders',
+    'relay',
+    'consume',
+)
+
+
+def percentile(latencies: List[float], percent: float) -> float:
+    """Return a percentile in milliseconds, nearest-rank method.
+    """
+    if not latencies:
+        return 0.0
+    ordered = sorted(latencies)
+    rank = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[rank] * 1000
+
+
+def summarize(name: str, count: int, errors: int, elapsed: float, latencies: List[float], unit: str) -> dict:
+    return {
+        'name': name,
+        'unit': unit,
+        'count': count,
+        'errors': errors,
+        'seconds': round(elapsed, 4),
+        'throughput': round(count / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+async def drive(name: str, send: Callable[[int], Awaitable], requests: int, concurrency: int) -> dict:
+    """Send requests from concurrent workers, recording each latency.
+
+    Args:
+        name (str): Scenario name
+        send (Callable[[int], Awaitable]): Sends the i-th request, returning the response
+        requests (int): Total number of requests
+        concurrency (int): Requests in flight
+
+    Returns:
+        dict: Scenario results
+    """
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while (index := next(counter)) < requests:
+            start = time.perf_counter()
+            response = await send(index)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, requests, errors, time.perf_counter() - start, latencies, 'req/s')
+
+
+async def bench_producer(args) -> List[dict]:
+    import httpx
+    from app.main import app
+    from app.health import warm_up
+
+    results = []
+    selected = set(args.scenarios)
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        while not warm_up.done:
+            await asyncio.sleep(0.05)
+
+        users = max(args.concurrency, 10)
+        password = 'benchmark'
+
+        async def seed_user(index: int):
+            return await client.post('/user/', json={
+                'name': f'seed {index}', 'email': f'seed{index}@bench.io', 'password': password,
+            })
+
+        async def create_user(index: int):
+            return await client.post('/user/', json={
+                'name': f'user {index}', 'email': f'user{index}@bench.io', 'password': password,
+            })
+
+        async def token(index: int):
+            return await client.post('/token', data={'username': f'seed{index % users}@bench.io', 'password': password})
+
+        # records read by the other scenarios, ids 1 to users
+        await drive('seed_users', seed_user, users, args.concurrency)
+        headers = []
+        for index in range(users):
+            response = await token(index)
+            headers.append({'Authorization': f'Bearer {response.json()["access_token"]}'})
+
+        async def seed_order(index: int):
+            return await client.post('/order/', json={'details': f'seed {index}'}, headers=headers[index])
+
+        async def create_order(index: int):
+            return await client.post('/order/', json={'details': f'order {index}'}, headers=headers[index % users])
+
+        async def get_user(index: int):
+            return await client.get(f'/user/{index % users + 1}')
+
+        async def get_order(index: int):
+            return await client.get(f'/order/{index % users + 1}')
+
+        async def list_users(index: int):
+            return await client.get('/user/list', params={'limit': 50})
+
+        async def list_orders(index: int):
+            return await client.get('/order/', params={'limit': 50})
+
+        await drive('seed_orders', seed_order, users, args.concurrency)
+
+        for name, send in (
+            ('create_user', create_user),
+            ('token', token),
+            ('create_order', create_order),
+            ('get_user', get_user),
+            ('get_order', get_order),
+            ('list_users', list_users),
+            ('list_orders', list_orders),
+        ):
+            if name in selected:
+                results.append(await drive(name, send, args.requests, args.concurrency))
+
+        if 'relay' in selected:
+            results.append(await bench_relay(args))
+    return results
+
+
+async def bench_relay(args) -> dict:
+    """Drain the outbox filled by the API into the in-memory broker, as the relay process does.
+    Failed batches are rolled back and retried, the scenario stops after 3 in a row.
+    """
+    from app import logger
+    from app.database import AsyncSessionLocal, get_async_engine
+    from app.outbox.relay import connect, relay_batch
+    from app.rmq_connector import AsyncRMQExchangeConnector, BufferedPublisher
+    from app.rmq_connector.topology import EXCHANGE, EXCHANGE_TYPE
+
+    rmq = AsyncRMQExchangeConnector(exchange=EXCHANGE, exchange_type=EXCHANGE_TYPE, confirm=True)
+    await connect(rmq)
+    latencies = []
+    relayed = 0
+    errors = 0
+    failures = 0
+    start = time.perf_counter()
+    async with rmq:
+        publisher = BufferedPublisher(rmq, batch_size=args.batch_size, policy='block')
+        publisher.start()
+        try:
+            while failures < 3:
+                batch_start = time.perf_counter()
+                async with AsyncSessionLocal(bind=get_async_engine()) as db:
+                    try:
+                        count = await relay_batch(db, publisher, args.batch_size)
+                    except Exception as exc:
+                        logger.error(f'Outbox relay batch failed: {exc!r}')
+                        errors += 1
+                        failures += 1
+                        continue
+                if not count:
+                    break
+                failures = 0
+                latencies.append(time.perf_counter() - batch_start)
+                relayed += count
+        finally:
+            await publisher.close()
+    return summarize('relay', relayed, errors, time.perf_counter() - start, latencies, 'msg/s')
+
+
+class RollupWriterStandIn():
+    """Keeps the consumer's rollups in memory instead of PostgreSQL.
+    """
+    def __init__(self):
+        self.rows = 0
+
+    def write(self, window_seconds, events, user_orders, user_failed_orders):
+        del window_seconds
+        self.rows += len(events) + len(user_orders.keys() | user_failed_orders.keys())
+
+    def close(self):
+        pass
+
+
+def failed_deliveries() -> float:
+    """Deliveries the consumer's callbacks failed, each republished for a retry or dead-lettered.
+    """
+    from prometheus_client import REGISTRY
+
+    return sum(
+        sample.value
+        for metric in REGISTRY.collect() if metric.name == 'consumer_retries'
+        for sample in metric.samples if sample.name == 'consumer_retries_total'
+    )
+
+
+def bench_consumer(args, broker) -> dict:
+    """Consume every queued message with the real consumer, stopped by SIGTERM once its queues are drained.
+    Synthetic order_created events are queued first, on top of the relayed ones.
+    """
+    import signal
+    import threading
+
+    import main
+    from common.codec import Event, EventType
+    from common.partition import order_partition_key
+
+    broker.exchange_declare('producer_log', 'topic')
+    for index in range(args.messages):
+        event = Event.create(EventType.ORDER_CREATED, order_id=index, user_id=index % 100, details=f'order {index}')
+        broker.publish('producer_log', order_partition_key(index % 100), event.encode(), event.properties())
+
+    def stop_when_drained():
+        with broker.condition:
+            # the consumer is consuming, so its SIGTERM handler is installed
+            broker.condition.wait_for(lambda: broker.consuming.issuperset(main.QUEUES) and broker.drained(main.QUEUES))
+        signal.raise_signal(signal.SIGTERM)
+
+    broker.latencies.clear()
+    errors = failed_deliveries()
+    threading.Thread(target=stop_when_drained, name='benchmark-stop', daemon=True).start()
+    start = time.perf_counter()
+    main.consume(rollup_writer=RollupWriterStandIn())
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for queue in main.QUEUES for latency in broker.latencies[queue]]
+    return summarize('consume', len(latencies), int(failed_deliveries() - errors), elapsed, latencies, 'msg/s')
+
+
+def stop_log_pipelines():
+    """Flush and close the log files of both services, before their directory is removed.
+    """
+    for module in ('app.log', 'log'):
+        if module in sys.modules:
+            sys.modules[module].pipeline.stop()
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000, help='requests per HTTP scenario')
+    parser.add_argument('--concurrency', type=int, default=16, help='requests in flight')
+    parser.add_argument('--messages', type=int, default=10000, help='synthetic events consumed')
+    parser.add_argument('--batch-size', type=int, default=500, help='outbox relay batch size')
+    parser.add_argument('--bcrypt-rounds', type=int, default=4, help='bcrypt cost, 12 in production')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='benchmark-')
+
+    # environment read by both services at import time
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(workdir, "benchmark.db")}'
+    os.environ['LOG_DIR'] = workdir
+    os.environ['EVENT_STORE_DIR'] = os.path.join(workdir, 'events')
+    os.environ['BCRYPT_ROUNDS'] = str(args.bcrypt_rounds)
+    os.environ['PASSWORD_MAX_PENDING'] = str(max(64, args.concurrency * 2))
+    sys.path[:0] = [ROOT, os.path.join(ROOT, 'producer'), os.path.join(ROOT, 'consumer'), os.path.dirname(__file__)]
+
+    from amqp import InMemoryBroker, InMemoryConnectionFactory
+    from app.bootstrap import bootstrap
+    from common.connection import set_connection_factory
+
+    try:
+        bootstrap()
+        broker = InMemoryBroker()
+        set_connection_factory(InMemoryConnectionFactory(broker))
+
+        results = asyncio.run(bench_producer(args))
+        if 'consume' in args.scenarios:
+            results.append(bench_consumer(args, broker))
+    finally:
+        stop_log_pipelines()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'revision': git_revision(),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'messages': args.messages,
+            'batch_size': args.batch_size,
+            'bcrypt_rounds': args.bcrypt_rounds,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import time
+import uuid
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Dict, Tuple
+
+import msgpack
+import pika
+
+
+CONTENT_TYPE = 'application/msgpack'
+SCHEMA_VERSION = 1
+
+
+class EventType(str, Enum):
+    USER_CREATED = 'user_created'
+    USER_CREATION_FAILED = 'user_creation_failed'
+    ORDER_CREATED = 'order_created'
+    ORDER_CREATION_FAILED = 'order_creation_failed'
+
+
+# (event, schema version) -> fields, in encoding order
+# a new version is added whenever an event's fields change, old ones stay decodable
+EVENT_FIELDS: Dict[Tuple[EventType, int], Tuple[str, ...]] = {
+    (EventType.USER_CREATED, 1): ('user_id', 'email'),
+    (EventType.USER_CREATION_FAILED, 1): ('email',),
+    (EventType.ORDER_CREATED, 1): ('order_id', 'user_id', 'details'),
+    (EventType.ORDER_CREATION_FAILED, 1): ('user_id',),
+}
+
+
+class UnsupportedMessage(Exception):
+    """The message isn't an event of a known type, schema version or content type."""
+
+
+@dataclass(frozen=True)
+class Event():
+    """Typed event, encoded as a msgpack array of its fields.
+    The event type, schema version and message id travel as AMQP properties.
+    """
+    type: EventType
+    data: Dict[str, Any]
+    message_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    occurred_at: float = field(default_factory=time.time)
+    schema_version: int = SCHEMA_VERSION
+
+    @classmethod
+    def create(cls, event_type: EventType, **data: Any) -> 'Event':
+        """Build an event of the current schema version.
+
+        Args:
+            event_type (EventType): Event type
+            data (Any): Event fields, exactly as listed in EVENT_FIELDS
+
+        Raises:
+            ValueError: If the fields don't match the schema
+
+        Returns:
+            Event: New event, with a fresh message id
+        """
+        fields = EVENT_FIELDS[(event_type, SCHEMA_VERSION)]
+        if set(data) != set(fields):
+            raise ValueError(f'{event_type.value} expects fields {fields}, got {tuple(data)}')
+        return cls(type=event_type, data=data)
+
+    def encode(self) -> bytes:
+        """Return the message body.
+        """
+        fields = EVENT_FIELDS[(self.type, self.schema_version)]
+        return msgpack.packb([self.occurred_at, *(self.data[name] for name in fields)])
+
+    def properties(self) -> pika.BasicProperties:
+        """Return the message properties.
+        """
+        return message_properties(self.type, self.message_id, self.schema_version, self.occurred_at)
+
+
+def message_properties(
+    event_type: EventType | str,
+    message_id: str,
+    schema_version: int = SCHEMA_VERSION,
+    occurred_at: float | None = None,
+) -> pika.BasicProperties:
+    """Build the properties of an encoded event.
+
+    Args:
+        event_type (EventType | str): Event type
+        message_id (str): Unique message id, consumers use it to detect redeliveries
+        schema_version (int, optional): Body schema version. Defaults to SCHEMA_VERSION.
+        occurred_at (float, optional): Event time. Defaults to now.
+
+    Returns:
+        pika.BasicProperties: Persistent message properties
+    """
+    event_type = EventType(event_type)
+    return pika.BasicProperties(
+        content_type=CONTENT_TYPE,
+        delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+        message_id=message_id,
+        timestamp=int(occurred_at if occurred_at is not None else time.time()),
+        type=event_type.value,
+        headers={'event': event_type.value, 'schema_version': schema_version},
+    )
+
+
+def decode(properties: pika.BasicProperties, body: bytes) -> Event:
+    """Decode a received message.
+
+    Args:
+        properties (pika.BasicProperties): Message properties
+        body (bytes): Message body
+
+    Raises:
+        UnsupportedMessage: If the message can't be decoded
+
+    Returns:
+        Event: Decoded event
+    """
+    if properties.content_type != CONTENT_TYPE:
+        raise UnsupportedMessage(f'Unsupported content type {properties.content_type!r}')
+
+    headers = properties.headers or {}
+    try:
+        key = (EventType(headers.get('event')), int(headers.get('schema_version')))
+        fields = EVENT_FIELDS[key]
+    except (KeyError, TypeError, ValueError):
+        raise UnsupportedMessage(f'Unsupported event {headers!r}')
+
+    try:
+        occurred_at, *values = msgpack.unpackb(body)
+    except (ValueError, TypeError, msgpack.UnpackException) as exc:
+        raise UnsupportedMessage(f'Invalid {key[0].value} body: {exc!r}')
+    if len(values) != len(fields):
+        raise UnsupportedMessage(f'{key[0].value} v{key[1]} expects {len(fields)} fields, got {len(values)}')
+
+    return Event(
+        type=key[0],
+        data=dict(zip(fields, values)),
+        message_id=properties.message_id,
+        occurred_at=occurred_at,
+        schema_version=key[1],
+    )
@@ -0,0 +1,46 @@
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+
+
+class ConnectionFactory():
+    """Opens the pika connections of both services.
+    Offline harnesses, such as the benchmarks, install their own with set_connection_factory.
+    """
+    def blocking(self, parameters: pika.ConnectionParameters) -> pika.BlockingConnection:
+        """Open a blocking connection.
+
+        Args:
+            parameters (pika.ConnectionParameters): Connection parameters
+
+        Returns:
+            pika.BlockingConnection: Open connection
+        """
+        return pika.BlockingConnection(parameters=parameters)
+
+    def asyncio(self, parameters: pika.ConnectionParameters, **callbacks) -> AsyncioConnection:
+        """Start opening a connection on an asyncio event loop.
+
+        Args:
+            parameters (pika.ConnectionParameters): Connection parameters
+            callbacks: AsyncioConnection's callbacks and custom_ioloop
+
+        Returns:
+            AsyncioConnection: Connection, usable once on_open_callback is called
+        """
+        return AsyncioConnection(parameters=parameters, **callbacks)
+
+
+_factory = ConnectionFactory()
+
+
+def connection_factory() -> ConnectionFactory:
+    """Return the process-wide connection factory.
+    """
+    return _factory
+
+
+def set_connection_factory(factory: ConnectionFactory):
+    """Replace the process-wide connection factory, before any connection is opened.
+    """
+    global _factory
+    _factory = factory
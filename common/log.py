@@ -0,0 +1,289 @@
+import atexit
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from enum import Enum
+from multiprocessing import util
+from typing import List, Union
+
+
+class OverflowPolicy(str, Enum):
+    """Behaviour of the logging queue when the writer falls behind."""
+    BLOCK = 'block'
+    DROP = 'drop'
+    SAMPLE = 'sample'
+
+
+class OverflowQueueHandler(logging.Handler):
+    """Hands records over to the background writer without doing any I/O.
+    When the queue is full, records are blocked on, dropped or sampled.
+    Warnings and errors are never dropped, they wait for room in the queue.
+    """
+    def __init__(self, record_queue: queue.Queue, policy: OverflowPolicy, sample_rate: int):
+        """Initialize the handler.
+
+        Args:
+            record_queue (queue.Queue): Bounded queue drained by the writer
+            policy (OverflowPolicy): Behaviour when the queue is full
+            sample_rate (int): With 'sample', one in sample_rate records is kept while full
+        """
+        super().__init__()
+        self.queue = record_queue
+        self.policy = policy
+        self.sample_rate = max(1, sample_rate)
+        self.dropped = 0
+        self._overflowed = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Merge arguments into the message, so the record is safe to pass between threads.
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record: logging.LogRecord):
+        record = self.prepare(record)
+        if self.policy == OverflowPolicy.BLOCK:
+            self.queue.put(record)
+            return
+
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            self._overflowed += 1
+
+        keep = record.levelno >= logging.WARNING or (
+            self.policy == OverflowPolicy.SAMPLE and self._overflowed % self.sample_rate == 0
+        )
+        if keep:
+            self.queue.put(record)
+        else:
+            self.dropped += 1
+
+
+class BufferedRotatingFileHandler(logging.FileHandler):
+    """File handler writing through a large buffer, flushed by the background writer.
+    Rotates once the file reaches max_bytes or every rotate_seconds.
+    """
+    def __init__(self, filename: str, max_bytes: int, rotate_seconds: float, backup_count: int, buffer_size: int):
+        """Open the log file.
+
+        Args:
+            filename (str): Log file path
+            max_bytes (int): Size triggering a rotation, 0 disables it
+            rotate_seconds (float): Interval triggering a rotation, 0 disables it
+            backup_count (int): Rotated files kept
+            buffer_size (int): Write buffer size in bytes
+        """
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.buffer_size = buffer_size
+        super().__init__(filename, mode='a', encoding='UTF-8', delay=True)
+        self._reset_rollover()
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, encoding=self.encoding, buffering=self.buffer_size)
+
+    def _reset_rollover(self):
+        self._size = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+        self._rollover_at = time.time() + self.rotate_seconds if self.rotate_seconds else None
+
+    def _should_rollover(self) -> bool:
+        if self.max_bytes and self._size >= self.max_bytes:
+            return True
+        return self._rollover_at is not None and time.time() >= self._rollover_at
+
+    def do_rollover(self):
+        """Close the current file, shift the backups and open a new file.
+        """
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f'{self.baseFilename}.{index}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.baseFilename}.{index + 1}')
+        if os.path.exists(self.baseFilename):
+            if self.backup_count:
+                os.replace(self.baseFilename, f'{self.baseFilename}.1')
+            else:
+                os.remove(self.baseFilename)
+
+        self.stream = self._open()
+        self._reset_rollover()
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            if self._should_rollover():
+                self.do_rollover()
+            if self.stream is None:
+                self.stream = self._open()
+            message = self.format(record) + self.terminator
+            self.stream.write(message)
+            self._size += len(message)
+        except Exception:
+            self.handleError(record)
+
+
+class LogWriter(threading.Thread):
+    """Background thread draining the record queue in batches.
+    Each batch is written into the file buffer and flushed once.
+    """
+    _sentinel = None
+
+    def __init__(
+        self,
+        record_queue: queue.Queue,
+        handler: BufferedRotatingFileHandler,
+        queue_handler: OverflowQueueHandler,
+        batch_size: int,
+        flush_interval: float,
+    ):
+        super().__init__(name='log-writer', daemon=True)
+        self.queue = record_queue
+        self.handler = handler
+        self.queue_handler = queue_handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._reported_drops = 0
+
+    def _next_batch(self) -> List[Union[logging.LogRecord, None]]:
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size and batch[-1] is not self._sentinel:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _report_drops(self):
+        dropped = self.queue_handler.dropped
+        if dropped > self._reported_drops:
+            record = logging.LogRecord(
+                'log', logging.WARNING, __file__, 0,
+                f'{dropped - self._reported_drops} log records dropped under overload', None, None,
+            )
+            self.handler.handle(record)
+            self._reported_drops = dropped
+
+    def run(self):
+        while True:
+            batch = self._next_batch()
+            for record in batch:
+                if record is not self._sentinel:
+                    self.handler.handle(record)
+            self._report_drops()
+            self.handler.flush()
+            if batch and batch[-1] is self._sentinel:
+                return
+
+    def stop(self):
+        """Write every queued record, then stop the thread.
+        """
+        self.queue.put(self._sentinel)
+        self.join()
+
+
+class LogPipeline():
+    """Non-blocking logging setup: a bounded queue handler and a batching file writer.
+    Forked children restart the pipeline on their own file, since threads don't survive a fork.
+    """
+    def __init__(self, logger: logging.Logger, prefix: str):
+        """Initialize the pipeline without starting it.
+
+        Args:
+            logger (logging.Logger): Logger receiving the queue handler
+            prefix (str): Log file name prefix, the host name is appended
+        """
+        self.logger = logger
+        self.prefix = prefix
+        self.writer: Union[LogWriter, None] = None
+        self.queue_handler: Union[OverflowQueueHandler, None] = None
+
+    def _filename(self, child: bool) -> str:
+        # create log files on Container or Local structure
+        directory = os.environ.get('LOG_DIR') or ('./logs' if os.path.isdir('./logs') else '.')
+        suffix = f'-{os.getpid()}' if child else ''
+        return os.path.join(directory, f'{self.prefix}-{socket.gethostname()}{suffix}.log')
+
+    def start(self, child: bool = False):
+        """Attach a new queue handler and start its writer thread.
+
+        Args:
+            child (bool, optional): Whether running in a forked child. Defaults to False.
+        """
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        file_handler = BufferedRotatingFileHandler(
+            self._filename(child),
+            max_bytes=int(os.environ.get('LOG_MAX_BYTES', 50 * 1024 * 1024)),
+            rotate_seconds=float(os.environ.get('LOG_ROTATE_SECONDS', 24 * 60 * 60)),
+            backup_count=int(os.environ.get('LOG_BACKUP_COUNT', 5)),
+            buffer_size=int(os.environ.get('LOG_BUFFER_SIZE', 64 * 1024)),
+        )
+        file_handler.setFormatter(formatter)
+
+        record_queue = queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', 10000)))
+        self.queue_handler = OverflowQueueHandler(
+            record_queue,
+            policy=OverflowPolicy(os.environ.get('LOG_OVERFLOW', 'drop')),
+            sample_rate=int(os.environ.get('LOG_SAMPLE_RATE', 10)),
+        )
+        self.queue_handler.setFormatter(formatter)
+
+        self.writer = LogWriter(
+            record_queue,
+            file_handler,
+            self.queue_handler,
+            batch_size=int(os.environ.get('LOG_BATCH_SIZE', 512)),
+            flush_interval=float(os.environ.get('LOG_FLUSH_INTERVAL', 1)),
+        )
+        self.writer.start()
+        self.logger.addHandler(self.queue_handler)
+
+    def stop(self):
+        """Detach the queue handler and flush every pending record.
+        """
+        if self.writer is None:
+            return
+        self.logger.removeHandler(self.queue_handler)
+        self.writer.stop()
+        self.writer.handler.close()
+        self.writer = None
+
+    def _after_fork(self):
+        # the parent's writer thread doesn't exist in the child
+        self.logger.removeHandler(self.queue_handler)
+        self.writer = None
+        self.start(child=True)
+        util.Finalize(None, self.stop, exitpriority=0)
+
+
+
+def start_pipeline(logger: logging.Logger, prefix: str) -> LogPipeline:
+    """Log a service's records through a pipeline, flushed on exit and restarted in forked children.
+
+    Args:
+        logger (logging.Logger): Service's logger, set to INFO
+        prefix (str): Log file name prefix, e.g. 'producer'
+
+    Returns:
+        LogPipeline: The started pipeline
+    """
+    logger.setLevel(logging.INFO)
+    pipeline = LogPipeline(logger, prefix=prefix)
+    pipeline.start()
+    atexit.register(pipeline.stop)
+    os.register_at_fork(after_in_child=pipeline._after_fork)
+    return pipeline
@@ -0,0 +1,45 @@
+import os
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Map a key to one of buckets with Lamping and Veach's jump consistent hash.
+    Going from n to n + 1 buckets moves only 1 / (n + 1) of the keys, all to the new bucket.
+
+    Args:
+        key (int): Non-negative key, e.g. a user id
+        buckets (int): Number of buckets, at least 1
+
+    Returns:
+        int: Bucket in [0, buckets)
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+# order partition queues, order.info.0 to order.info.<n - 1>, the same on both services
+ORDER_PARTITIONS = int(os.environ.get('ORDER_PARTITIONS', 4))
+
+# one consumer at a time per order partition, keeping each user's events in order
+PARTITION_ARGUMENTS = {'x-single-active-consumer': True}
+
+
+def order_partition_key(created_by: int, partitions: int = ORDER_PARTITIONS) -> str:
+    """Routing key of an order event, partitioned by its creator.
+    Every event of a user goes to the same queue, consumed by a single active consumer.
+
+    Args:
+        created_by (int): Order creator's id
+        partitions (int, optional): Number of partitions. Defaults to ORDER_PARTITIONS
+            If 0, the unpartitioned 'order.info' key is returned
+
+    Returns:
+        str: 'order.info.<partition>'
+    """
+    if not partitions:
+        return 'order.info'
+    return f'order.info.{jump_hash(created_by, partitions)}'
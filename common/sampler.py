@@ -0,0 +1,160 @@
+import asyncio
+import inspect
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Dict, List, Union
+
+
+def _label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f'{os.path.basename(code.co_filename)}:{getattr(code, "co_qualname", code.co_name)}'
+
+
+def _await_chain(coroutine) -> List[FrameType]:
+    """Frames of a suspended coroutine and of the ones it awaits, outermost first.
+    """
+    frames = []
+    while coroutine is not None:
+        frame = getattr(coroutine, 'cr_frame', None) or getattr(coroutine, 'gi_frame', None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coroutine = getattr(coroutine, 'cr_await', None) or getattr(coroutine, 'gi_yieldfrom', None)
+    return frames
+
+
+def _running(task: asyncio.Task) -> bool:
+    """Whether a task executes on its loop right now, rather than being suspended at an await.
+    asyncio.current_task only works from the loop's own thread, the coroutine's state is read instead.
+    """
+    return inspect.getcoroutinestate(task.get_coro()) == inspect.CORO_RUNNING
+
+
+class Target():
+    """A profiled call: a thread running it, or an asyncio task.
+    Frames above base, the profiling wrapper, are left out of its stacks.
+    """
+    def __init__(self, root: str, thread_id: int, base: CodeType, task: Union[asyncio.Task, None] = None):
+        self.root = root
+        self.thread_id = thread_id
+        self.base = base
+        self.task = task
+
+    def _collapse(self, frames: List[FrameType]) -> Union[str, None]:
+        """Join frames, outermost first, starting below the base frame.
+        """
+        for index, frame in enumerate(frames):
+            if frame.f_code is self.base:
+                frames = frames[index + 1:]
+                break
+        if not frames:
+            return None
+        return ';'.join([self.root, *map(_label, frames)])
+
+    def sample(self, frames: Dict[int, FrameType]) -> Union[str, None]:
+        """Return the target's collapsed stack, from every thread's current frame.
+        A task not running on its loop is sampled at the await it's suspended on.
+        """
+        if self.task is not None and not _running(self.task):
+            if self.task.done():
+                return None
+            stack = self._collapse(_await_chain(self.task.get_coro()))
+            return stack and f'{stack};(waiting)'
+
+        frame = frames.get(self.thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(frame)
+            frame = frame.f_back
+        return self._collapse(stack[::-1])
+
+
+class StackSampler():
+    """Samples the stacks of registered targets from a background thread,
+    counting them in the collapsed format read by flamegraph tools.
+    The thread sleeps while no target is registered, so profiling costs nothing when off.
+    """
+    def __init__(self, interval_ms: Union[float, None] = None, max_stacks: Union[int, None] = None):
+        """Initialize the sampler, its thread starts with the first target.
+
+        Args:
+            interval_ms (float, optional): Time between samples. Defaults to PROFILER_INTERVAL_MS
+            max_stacks (int, optional): Distinct stacks kept, others are dropped. Defaults to PROFILER_MAX_STACKS
+        """
+        self.interval = (interval_ms or float(os.environ.get('PROFILER_INTERVAL_MS', 5))) / 1000
+        self.max_stacks = max_stacks or int(os.environ.get('PROFILER_MAX_STACKS', 10000))
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.dropped = 0
+
+        self._targets: Dict[int, Target] = {}
+        self._tokens = itertools.count()
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread: Union[threading.Thread, None] = None
+
+    def add(self, target: Target) -> int:
+        """Start sampling a target.
+
+        Returns:
+            int: Token removing the target
+        """
+        token = next(self._tokens)
+        with self._lock:
+            self._targets[token] = target
+            if self._thread is None or not self._thread.is_alive():
+                # threads don't survive a fork, a forked worker starts its own
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+        self._active.set()
+        return token
+
+    def remove(self, token: int):
+        with self._lock:
+            self._targets.pop(token, None)
+            if not self._targets:
+                self._active.clear()
+
+    def _run(self):
+        this_thread = threading.get_ident()
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                targets = list(self._targets.values())
+            if not targets:
+                continue
+
+            frames = sys._current_frames()
+            frames.pop(this_thread, None)
+            for target in targets:
+                try:
+                    stack = target.sample(frames)
+                except Exception:
+                    # frames of a running thread may change while being read
+                    continue
+                if stack is None:
+                    continue
+                with self._lock:
+                    self.samples += 1
+                    if stack in self.stacks or len(self.stacks) < self.max_stacks:
+                        self.stacks[stack] += 1
+                    else:
+                        self.dropped += 1
+
+    def collapsed(self) -> str:
+        """Return the counted stacks, one 'frame;frame;frame count' line each.
+        """
+        with self._lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+            self.dropped = 0
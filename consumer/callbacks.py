@@ -1,18 +1,63 @@
+from typing import Callable
+
+from common.codec import Event, UnsupportedMessage, decode
 from log import logger
+from retry import retry
+from rollup import aggregator
+from store import event_store
+
+
+def _handle(queue: str, method, properties, body) -> str:
+    """Decode an event, store it and count it in the rollups, returning its log line.
+    Undecodable messages fall back to the raw body.
+    Wildcard bindings deliver some messages to two queues, only the queue named
+    after the routing key stores and counts them.
+    Partitioned keys, e.g. order.info.3, are stored and counted without their partition.
+    """
+    count = method.routing_key == queue
+    routing_key = '.'.join(method.routing_key.split('.')[:2])
+    try:
+        event: Event = decode(properties, body)
+    except UnsupportedMessage as exc:
+        logger.error(f'Undecodable message {properties.message_id}: {exc} {body!r}')
+        if count:
+            aggregator.add(routing_key, None)
+        return repr(body)
 
+    if count:
+        # stored first, a failing write is retried without counting the event twice
+        event_store.append(routing_key, event)
+        aggregator.add(routing_key, event)
+    fields = ' '.join(f'{name}={value}' for name, value in event.data.items())
+    return f'{event.type.value} v{event.schema_version} [{event.message_id}] {fields}'
 
+@retry('user.info')
 def user_info_callback(ch, method, properties, body):
-    del ch, method, properties
-    logger.info(f"user_info: {body.decode('UTF-8')}")
+    del ch
+    _handle('user.info', method, properties, body)
 
+@retry('user.error')
 def user_error_callback(ch, method, properties, body):
-    del ch, method, properties
-    logger.error(f"user_error: {body.decode('UTF-8')}")
+    del ch
+    logger.error(f"user_error: {_handle('user.error', method, properties, body)}")
 
+@retry('order.info')
 def oder_info_callback(ch, method, properties, body):
-    del ch, method, properties
-    logger.info(f"oder_info: {body.decode('UTF-8')}")
+    del ch
+    _handle('order.info', method, properties, body)
 
+@retry('order.error')
 def oder_error_callback(ch, method, properties, body):
-    del ch, method, properties
-    logger.error(f"oder_error: {body.decode('UTF-8')}")
+    del ch
+    logger.error(f"oder_error: {_handle('order.error', method, properties, body)}")
+
+def order_partition_callback(queue: str) -> Callable:
+    """Build the callback of an order partition queue, e.g. order.info.3.
+    Retries go back to the same partition, though they are processed after the user's later events.
+    """
+    @retry(queue)
+    def order_partition_info_callback(ch, method, properties, body):
+        del ch
+        _handle(queue, method, properties, body)
+
+    return order_partition_info_callback
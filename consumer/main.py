@@ -1,4 +1,9 @@
+import os
+import signal
+from typing import Iterable, Union
+
 from dotenv import load_dotenv
+load_dotenv()
 
 from rmq_connector import RMQExchangeConnector
 from callbacks import (
@@ -6,26 +11,70 @@ from callbacks import (
     user_error_callback,
     oder_info_callback,
     oder_error_callback,
+    order_partition_callback,
 )
 from log import logger
+from metrics import start_exporter
+from profiler import callback_profiler
+from retry import retry
+from rollup import Rollup, RollupWriter, aggregator
+from store import StoreFlusher, event_store
+from common.partition import ORDER_PARTITIONS, PARTITION_ARGUMENTS
 
 
-load_dotenv()
+# queue name: (binding key, callback, arguments)
+# 'order.info' drains the events published before orders were partitioned
+QUEUES = {
+    'user.info': ('user.*', user_info_callback, None),
+    'user.error': ('user.error', user_error_callback, None),
+    'order.info': ('order.*', oder_info_callback, None),
+    'order.error': ('order.error', oder_error_callback, None),
+    **{
+        f'order.info.{partition}': (
+            f'order.info.{partition}', order_partition_callback(f'order.info.{partition}'), PARTITION_ARGUMENTS,
+        )
+        for partition in range(ORDER_PARTITIONS)
+    },
+}
 
-if __name__ == '__main__':
+
+def consume(queues: Iterable[str] = tuple(QUEUES), rollup_writer: Union[RollupWriter, None] = None):
+    """Consume the given queues on a single connection until stopped.
+    SIGTERM stops consuming gracefully, flushing the rollups, the event store and pending acknowledgments.
+    SIGUSR1 switches callback profiling on or off.
+
+    Args:
+        queues (Iterable[str], optional): Queue names from QUEUES. Defaults to all
+        rollup_writer (RollupWriter, optional): Rollups' destination. Defaults to None
+            If None, the rollups are written to PostgreSQL
+    """
+    queues = tuple(queues)
     with RMQExchangeConnector(exchange='producer_log', exchange_type='topic') as rmq:
-        user_info_queue = rmq.create_queue(queue='user.info', binding_key='user.*')
-        user_error_queue = rmq.create_queue(queue='user.error', binding_key='user.error')
-        oder_info_queue = rmq.create_queue(queue='order.info', binding_key='order.*')
-        oder_error_queue = rmq.create_queue(queue='order.error', binding_key='order.error')
+        for queue in queues:
+            binding_key, callback, arguments = QUEUES[queue]
+            queue_name = rmq.create_queue(queue=queue, binding_key=binding_key, retry=retry, arguments=arguments)
+            rmq.basic_consume(queue_name, callback_profiler.wrap(queue_name, callback), batch_ack=True)
 
-        rmq.basic_consume(user_info_queue, user_info_callback)
-        rmq.basic_consume(user_error_queue, user_error_callback)
-        rmq.basic_consume(oder_info_queue, oder_info_callback)
-        rmq.basic_consume(oder_error_queue, oder_error_callback)
+        signal.signal(signal.SIGTERM, lambda signum, frame: rmq.request_stop())
+        signal.signal(signal.SIGUSR1, callback_profiler.toggle)
+        rollup = Rollup(aggregator, rollup_writer or RollupWriter())
+        rollup.start(rmq.connection)
+        store_flusher = StoreFlusher(event_store)
+        store_flusher.start(rmq.connection)
 
         try:
-            logger.info('Consumer initialized.')
+            logger.info(f'Consumer initialized on {", ".join(queues)}.')
             rmq.start_consuming()
         except KeyboardInterrupt:
-            logger.info('Consumer stopped.')
+            pass
+        # written before the pending acknowledgments are flushed on exit
+        rollup.stop()
+        store_flusher.stop()
+        if callback_profiler.enabled:
+            callback_profiler.dump()
+        logger.info('Consumer stopped.')
+
+
+if __name__ == '__main__':
+    start_exporter(int(os.environ.get('CONSUMER_METRICS_PORT', 9100)))
+    consume()
@@ -0,0 +1,99 @@
+import os
+import shutil
+import time
+from typing import Callable
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, start_http_server, multiprocess
+
+
+# seconds, from a logged event to a slow downstream write
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# seconds between the event's publication and its processing, timestamps have a 1s resolution
+LAG_BUCKETS = (1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+MESSAGES = Counter(
+    'consumer_messages_total',
+    'Messages processed by queue and outcome.',
+    ['queue', 'outcome'],
+)
+CALLBACK_LATENCY = Histogram(
+    'consumer_callback_duration_seconds',
+    'Callback duration by queue.',
+    ['queue'],
+    buckets=LATENCY_BUCKETS,
+)
+RETRIES = Counter(
+    'consumer_retries_total',
+    'Failed messages republished, by queue and destination (delay or dead_letter).',
+    ['queue', 'destination'],
+)
+LAG = Histogram(
+    'consumer_lag_seconds',
+    'Time between the message timestamp and its processing, by queue.',
+    ['queue'],
+    buckets=LAG_BUCKETS,
+)
+
+
+def instrument(queue: str, callback: Callable) -> Callable:
+    """Wrap a callback, recording its throughput, duration and lag.
+
+    Args:
+        queue (str): Queue's name, used as label
+        callback (Callable): Callback dispatched on message
+
+    Returns:
+        Callable: Instrumented callback
+    """
+    processed = MESSAGES.labels(queue, 'ok')
+    failed = MESSAGES.labels(queue, 'error')
+    latency = CALLBACK_LATENCY.labels(queue)
+    lag = LAG.labels(queue)
+
+    def on_message(ch, method, properties, body):
+        start = time.perf_counter()
+        if properties.timestamp:
+            lag.observe(max(0, time.time() - properties.timestamp))
+        try:
+            callback(ch, method, properties, body)
+        except Exception:
+            failed.inc()
+            raise
+        else:
+            processed.inc()
+        finally:
+            latency.observe(time.perf_counter() - start)
+
+    return on_message
+
+
+def reset_multiprocess_dir():
+    """Empty the directory sharing worker metrics, before any worker starts.
+    Metrics of a previous run would otherwise be summed with the new ones.
+    """
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def start_exporter(port: int):
+    """Serve the metrics over HTTP from a background thread.
+    Under the supervisor, every worker's metrics are aggregated from PROMETHEUS_MULTIPROC_DIR.
+
+    Args:
+        port (int): Listening port
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(port, registry=registry)
+    else:
+        start_http_server(port)
+
+
+def mark_process_dead(pid: int):
+    """Drop the live gauges of an exited worker, counters and histograms are kept.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,88 @@
+import itertools
+import os
+import threading
+import time
+from typing import Callable, Union
+
+from common.sampler import StackSampler, Target
+from log import logger
+
+
+class CallbackProfiler():
+    """Samples the call stacks of 1 in sample_rate callbacks while enabled.
+    Stacks are rooted at the queue's name, and written to a collapsed stacks file when profiling stops.
+    """
+    def __init__(
+        self,
+        sample_rate: Union[int, None] = None,
+        enabled: Union[bool, None] = None,
+        directory: Union[str, None] = None,
+    ):
+        """Initialize the profiler, unset arguments are read from the environment.
+
+        Args:
+            sample_rate (int, optional): Profile 1 in this many callbacks. Defaults to CONSUMER_PROFILER_SAMPLE_RATE
+            enabled (bool, optional): Profile from start. Defaults to CONSUMER_PROFILER_ENABLED
+            directory (str, optional): Written profiles' directory. Defaults to CONSUMER_PROFILER_DIR
+        """
+        self.sample_rate = max(1, sample_rate or int(os.environ.get('CONSUMER_PROFILER_SAMPLE_RATE', 10)))
+        self.enabled = os.environ.get('CONSUMER_PROFILER_ENABLED', 'false').lower() == 'true' if enabled is None else enabled
+        self.directory = directory or os.environ.get('CONSUMER_PROFILER_DIR', './profiles')
+        self.sampler = StackSampler()
+        self._callbacks = itertools.count(1)
+
+    def wrap(self, queue: str, callback: Callable) -> Callable:
+        """Wrap a callback, profiling it when selected.
+        When profiling is off, the wrapper only checks a flag.
+
+        Args:
+            queue (str): Queue's name, root of the callback's stacks
+            callback (Callable): Callback dispatched on message
+
+        Returns:
+            Callable: Profiled callback
+        """
+        def on_message(ch, method, properties, body):
+            if not self.enabled or next(self._callbacks) % self.sample_rate:
+                callback(ch, method, properties, body)
+                return
+
+            token = self.sampler.add(Target(queue, threading.get_ident(), on_message.__code__))
+            try:
+                callback(ch, method, properties, body)
+            finally:
+                self.sampler.remove(token)
+
+        return on_message
+
+    def toggle(self, signum=None, frame=None):
+        """Switch profiling on or off, usable as a signal handler.
+        Switching it off writes the profile from another thread, the handler may interrupt the sampler's lock holder.
+        """
+        del signum, frame
+        self.enabled = not self.enabled
+        if self.enabled:
+            logger.info(f'Profiling 1 in {self.sample_rate} callbacks.')
+        else:
+            threading.Thread(target=self.dump, name='profile-dump').start()
+
+    def dump(self) -> Union[str, None]:
+        """Write the sampled stacks to a new file, and drop them.
+
+        Returns:
+            str | None: Written file, None without samples
+        """
+        stacks = self.sampler.collapsed()
+        self.sampler.reset()
+        if not stacks:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'consumer-{os.getpid()}-{time.strftime("%Y%m%dT%H%M%S")}.folded')
+        with open(path, 'w') as file:
+            file.write(stacks)
+        logger.info(f'Profile written to {path}.')
+        return path
+
+
+callback_profiler = CallbackProfiler()
@@ -0,0 +1,134 @@
+import copy
+import functools
+import os
+from typing import Callable, List, Union
+
+from log import logger
+from metrics import RETRIES
+
+
+# headers carried by republished messages
+ATTEMPT_HEADER = 'x-attempt'
+ROUTING_KEY_HEADER = 'x-original-routing-key'
+ERROR_HEADER = 'x-last-error'
+
+
+class RetryPolicy():
+    """Delayed retries with exponential backoff, then parking in a dead-letter queue.
+
+    A failed message is acknowledged and republished to a delay queue, whose TTL
+    dead-letters it back to its queue through the default exchange. Each delay has
+    its own queue, so messages expire in order and never wait behind longer delays.
+    After max_attempts, the message is published to the dead-letter exchange instead.
+    The consumed queues keep their arguments, so existing queues needn't be recreated.
+    """
+    def __init__(
+        self,
+        max_attempts: Union[int, None] = None,
+        base_delay_ms: Union[int, None] = None,
+        dead_letter_exchange: str = 'producer_log.dlx',
+    ):
+        """Initialize the policy.
+
+        Args:
+            max_attempts (int, optional): Deliveries before dead-lettering. Defaults to None
+                If None, CONSUMER_MAX_ATTEMPTS is used. 1 disables retries
+            base_delay_ms (int, optional): Delay before the first retry, doubled on each one. Defaults to None
+                If None, CONSUMER_RETRY_DELAY_MS is used
+            dead_letter_exchange (str, optional): Direct exchange routing to the dead-letter queues.
+                Defaults to 'producer_log.dlx'
+        """
+        self.max_attempts = max(1, max_attempts or int(os.environ.get('CONSUMER_MAX_ATTEMPTS', 5)))
+        self.base_delay_ms = base_delay_ms or int(os.environ.get('CONSUMER_RETRY_DELAY_MS', 1000))
+        self.dead_letter_exchange = dead_letter_exchange
+
+    @property
+    def delays_ms(self) -> List[int]:
+        """Delay before each retry, in milliseconds.
+        """
+        return [self.base_delay_ms * 2 ** retry for retry in range(self.max_attempts - 1)]
+
+    def delay_queue(self, queue: str, attempt: int) -> str:
+        """Name of the queue delaying a message that failed its attempt-th delivery.
+        The delay is part of the name, a new policy declares new queues.
+        """
+        return f'{queue}.retry.{self.delays_ms[attempt - 1]}ms'
+
+    @staticmethod
+    def dead_letter_queue(queue: str) -> str:
+        return f'{queue}.dlq'
+
+    def declare(self, channel, queue: str):
+        """Declare the delay queues and the dead-letter queue of a queue.
+
+        Args:
+            channel (BlockingChannel): Channel declaring the topology
+            queue (str): Consumed queue's name
+        """
+        channel.exchange_declare(exchange=self.dead_letter_exchange, exchange_type='direct', durable=True)
+        channel.queue_declare(queue=self.dead_letter_queue(queue), durable=True)
+        channel.queue_bind(exchange=self.dead_letter_exchange, queue=self.dead_letter_queue(queue), routing_key=queue)
+
+        for attempt, delay in enumerate(self.delays_ms, start=1):
+            channel.queue_declare(
+                queue=self.delay_queue(queue, attempt),
+                durable=True,
+                arguments={
+                    'x-message-ttl': delay,
+                    'x-dead-letter-exchange': '',
+                    'x-dead-letter-routing-key': queue,
+                },
+            )
+
+    def __call__(self, queue: str) -> Callable:
+        """Decorate a callback of a queue declared with this policy.
+        Exceptions are caught and the message is scheduled for a retry or dead-lettered,
+        so the callback always returns and the message is acknowledged.
+
+        Args:
+            queue (str): Consumed queue's name
+
+        Returns:
+            Callable: Decorator
+        """
+        def decorator(callback: Callable) -> Callable:
+            delayed = RETRIES.labels(queue, 'delay')
+            dead_lettered = RETRIES.labels(queue, 'dead_letter')
+
+            @functools.wraps(callback)
+            def on_message(ch, method, properties, body):
+                headers = properties.headers or {}
+                attempt = headers.get(ATTEMPT_HEADER, 1)
+                routing_key = headers.get(ROUTING_KEY_HEADER)
+                if routing_key is not None:
+                    # redelivered through the default exchange, with the queue as routing key
+                    method = copy.copy(method)
+                    method.routing_key = routing_key
+
+                try:
+                    callback(ch, method, properties, body)
+                except Exception as exc:
+                    retrying = attempt < self.max_attempts
+                    properties = copy.copy(properties)
+                    # dead-lettered messages keep the number of their last attempt
+                    properties.headers = {
+                        **headers,
+                        ATTEMPT_HEADER: attempt + retrying,
+                        ROUTING_KEY_HEADER: method.routing_key,
+                        ERROR_HEADER: repr(exc)[:256],
+                    }
+                    if retrying:
+                        target = self.delay_queue(queue, attempt)
+                        ch.basic_publish(exchange='', routing_key=target, body=body, properties=properties)
+                        delayed.inc()
+                        logger.warning(f'{queue}: attempt {attempt} of {properties.message_id} failed, retrying from {target}: {exc!r}')
+                    else:
+                        ch.basic_publish(exchange=self.dead_letter_exchange, routing_key=queue, body=body, properties=properties)
+                        dead_lettered.inc()
+                        logger.error(f'{queue}: {properties.message_id} failed {attempt} times, parked in {self.dead_letter_queue(queue)}: {exc!r}')
+
+            return on_message
+        return decorator
+
+
+retry = RetryPolicy()
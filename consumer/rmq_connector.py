@@ -3,22 +3,105 @@ from typing import Union, Callable
 
 import pika
 
+from common.connection import connection_factory
+from metrics import instrument
+from retry import RetryPolicy
+
+
+class BatchAcknowledger():
+    """Acknowledges a channel's messages in batches.
+    Callbacks run one at a time in delivery order, so acknowledging the last
+    processed delivery tag with 'multiple' covers every message before it.
+    """
+    def __init__(self, connection: pika.BlockingConnection, channel, batch_size: int, interval_ms: int):
+        """Initialize an empty batch.
+
+        Args:
+            connection (pika.BlockingConnection): Connection running the timers
+            channel (BlockingChannel): Channel whose messages are acknowledged
+            batch_size (int): Acknowledge after this many messages
+            interval_ms (int): Acknowledge pending messages after this many milliseconds
+        """
+        self.connection = connection
+        self.channel = channel
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+
+        self._last_tag: Union[int, None] = None
+        self._unacked = 0
+        self._timer = None
+
+    def wrap(self, callback: Callable) -> Callable:
+        """Wrap a callback, recording its message for the next batch acknowledgment.
+
+        Args:
+            callback (Callable): Callback dispatched on message
+
+        Returns:
+            Callable: Callback acknowledging in batches
+        """
+        def on_message(ch, method, properties, body):
+            try:
+                callback(ch, method, properties, body)
+            except Exception:
+                # keep the failed message unacknowledged, but release the ones before it
+                self.flush()
+                raise
+
+            self._last_tag = method.delivery_tag
+            self._unacked += 1
+            if self._unacked >= self.batch_size:
+                self.flush()
+            elif self._timer is None:
+                self._timer = self.connection.call_later(self.interval, self._on_timer)
+
+        return on_message
+
+    def _on_timer(self):
+        self._timer = None
+        self.flush()
+
+    def flush(self):
+        """Acknowledge every processed message not yet acknowledged.
+        """
+        if self._timer is not None:
+            self.connection.remove_timeout(self._timer)
+            self._timer = None
+
+        if self._last_tag is not None and self.channel.is_open:
+            self.channel.basic_ack(delivery_tag=self._last_tag, multiple=True)
+        self._last_tag = None
+        self._unacked = 0
+
 
 class RMQExchangeConnector():
     """RabbitMQ Single Exchange Connector.
     Provides a context manager for a single exchange,
     whose parameters are declared during initialization.
     """
-    def __init__(self, exchange: str = '', exchange_type: str = 'fanout'):
+    def __init__(
+        self,
+        exchange: str = '',
+        exchange_type: str = 'fanout',
+        prefetch_count: Union[int, None] = None,
+        ack_batch_size: Union[int, None] = None,
+        ack_interval_ms: Union[int, None] = None,
+    ):
         """Create a RMQ connection and initialize exchange parameters.
 
         Args:
             exchange (str, optional): Exchange name. Defaults to ''.
             exchange_type (str, optional): Exchange type. Defaults to 'fanout'.
                 Accepts [fanout, direct, topic], 'headers' won't work
+            prefetch_count (int, optional): Unacknowledged messages per consumer. Defaults to None
+                If None, PIKA_PREFETCH_COUNT is used. 0 means unlimited
+            ack_batch_size (int, optional): Messages per batch acknowledgment. Defaults to None
+                If None, PIKA_ACK_BATCH_SIZE is used. Keep it below prefetch_count
+            ack_interval_ms (int, optional): Maximum delay of a batch acknowledgment. Defaults to None
+                If None, PIKA_ACK_INTERVAL_MS is used
         """
-        self.connection = pika.BlockingConnection(
-            parameters=pika.ConnectionParameters(
+        self.connection = connection_factory().blocking(
+            pika.ConnectionParameters(
                 host=os.environ.get('PIKA_HOST', 'rabbitmq'),
                 port=os.environ.get('PIKA_PORT', 5672),
                 credentials=pika.PlainCredentials(
@@ -31,6 +114,11 @@ class RMQExchangeConnector():
         )
         self.exchange = exchange
         self.exchange_type = exchange_type
+        self.prefetch_count = int(
+            os.environ.get('PIKA_PREFETCH_COUNT', 200) if prefetch_count is None else prefetch_count
+        )
+        self.ack_batch_size = ack_batch_size or int(os.environ.get('PIKA_ACK_BATCH_SIZE', 50))
+        self.ack_interval_ms = ack_interval_ms or int(os.environ.get('PIKA_ACK_INTERVAL_MS', 200))
 
     def __enter__(self) -> 'RMQExchangeConnector':
         """Initialize the context manager with the creation of the Exchange.
@@ -39,6 +127,14 @@ class RMQExchangeConnector():
             RMQExchangeConnector: self
         """
         self.channel = self.connection.channel()
+        if self.prefetch_count:
+            self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        self.acknowledger = BatchAcknowledger(
+            self.connection,
+            self.channel,
+            batch_size=self.ack_batch_size,
+            interval_ms=self.ack_interval_ms,
+        )
         self._create_exchange()
 
         return self
@@ -47,6 +143,7 @@ class RMQExchangeConnector():
         """Exit the context manager closing the connection.
         """
         self.channel.stop_consuming()
+        self.acknowledger.flush()
         self.channel.close()
         self.connection.close()
 
@@ -59,13 +156,23 @@ class RMQExchangeConnector():
             durable=True,
         )
 
-    def create_queue(self, queue: str = '', binding_key: Union[str, None] = None) -> str:
+    def create_queue(
+        self,
+        queue: str = '',
+        binding_key: Union[str, None] = None,
+        retry: Union[RetryPolicy, None] = None,
+        arguments: Union[dict, None] = None,
+    ) -> str:
         """Create a new Queue for the instance's Exchange.
 
         Args:
             queue (str, optional): Queue's name. Defaults to '' (random)
             binding_key (str, optional): Binding key. Defaults to None
                 If None, Queue's name is used.
+            retry (RetryPolicy, optional): Also declare the queue's delay and dead-letter queues.
+                Defaults to None. The callback must be decorated with the same policy
+            arguments (dict, optional): Queue arguments, e.g. x-single-active-consumer. Defaults to None
+                Must match the producer's declaration
 
         Returns:
             str: Queue's name
@@ -73,6 +180,7 @@ class RMQExchangeConnector():
         queue = self.channel.queue_declare(
             queue=queue,
             durable=True,
+            arguments=arguments,
         )
         queue_name = queue.method.queue
 
@@ -81,9 +189,11 @@ class RMQExchangeConnector():
             queue=queue_name,
             routing_key=binding_key or queue_name,
         )
+        if retry is not None:
+            retry.declare(self.channel, queue_name)
         return queue_name
 
-    def basic_consume(self, queue_name: str, callback: Callable, auto_ack: bool = True):
+    def basic_consume(self, queue_name: str, callback: Callable, auto_ack: bool = True, batch_ack: bool = False):
         """Consume messages from a queue.
 
         Args:
@@ -91,7 +201,15 @@ class RMQExchangeConnector():
             callback (Callable): Callback dispatched on message
             auto_ack (bool, optional): Auto acknowledgment. Defaults to True.
                 If False, callback must handle acknowledgment
+            batch_ack (bool, optional): Batch manual acknowledgment. Defaults to False.
+                If True, auto_ack is disabled and processed messages
+                are acknowledged in batches once the callback returns
         """
+        callback = instrument(queue_name, callback)
+        if batch_ack:
+            callback = self.acknowledger.wrap(callback)
+            auto_ack = False
+
         self.channel.basic_consume(
             queue=queue_name,
             on_message_callback=callback,
@@ -102,3 +220,8 @@ class RMQExchangeConnector():
         """Dispatch basic_consume callbacks until all consumers are cancelled.
         """
         self.channel.start_consuming()
+
+    def request_stop(self):
+        """Ask start_consuming to return, safe to call from signal handlers and other threads.
+        """
+        self.connection.add_callback_threadsafe(self.channel.stop_consuming)
@@ -0,0 +1,472 @@
+"""Append-only event store, queryable by time range, routing key and user.
+
+    python store.py query --from 2024-01-01T10:00 --to 2024-01-01T10:05 --user-id 42
+    python store.py maintain
+"""
+import argparse
+import contextlib
+import heapq
+import json
+import os
+import shutil
+import socket
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterable, Iterator, List, Tuple, Union
+
+import msgpack
+import pika
+
+from common.codec import Event
+from log import logger
+
+
+# little-endian length of the msgpack payload following it
+RECORD_HEADER = struct.Struct('<I')
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.idx'
+# sorted copy of a segment, merged by compactions
+RUN_SUFFIX = '.run'
+COMPACTED = 'compacted'
+
+
+def _read_records(data: bytes) -> Iterator[Tuple[int, list]]:
+    """Iterate over length-prefixed records, stopping at a truncated one.
+
+    Yields:
+        Tuple[int, list]: Offset following the record, and the record
+    """
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        length, = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        if start + length > len(data):
+            return
+        offset = start + length
+        yield offset, msgpack.unpackb(data[start:offset], raw=False)
+
+
+def _stream_records(file: BinaryIO) -> Iterator[list]:
+    """Read length-prefixed records one at a time from a file, stopping at a truncated one.
+    """
+    while True:
+        header = file.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        length, = RECORD_HEADER.unpack(header)
+        payload = file.read(length)
+        if len(payload) < length:
+            return
+        yield msgpack.unpackb(payload, raw=False)
+
+
+def _sorted_by_time(path: str) -> bool:
+    with open(path, 'rb') as file:
+        previous = float('-inf')
+        for record in _stream_records(file):
+            if record[0] < previous:
+                return False
+            previous = record[0]
+    return True
+
+
+def _frame(record: list) -> bytes:
+    payload = msgpack.packb(record, use_bin_type=True)
+    return RECORD_HEADER.pack(len(payload)) + payload
+
+
+class SegmentWriter():
+    """Appends events to a segment, indexing them by blocks.
+    Each sealed block gets an index entry with its byte range, time range,
+    routing keys and user ids, so queries only read the blocks that may match.
+    """
+    def __init__(self, path: str, block_size: int):
+        """Open a segment for appending, its index is the same path with INDEX_SUFFIX.
+
+        Args:
+            path (str): Segment's path without suffix
+            block_size (int): Events per indexed block
+        """
+        self.block_size = block_size
+        self.data: BinaryIO = open(path + SEGMENT_SUFFIX, 'ab')
+        self.index: BinaryIO = open(path + INDEX_SUFFIX, 'ab')
+        if self.data.tell():
+            # drop a record cut short by a crash, following ones would be unreadable
+            with open(path + SEGMENT_SUFFIX, 'rb') as file:
+                complete = 0
+                for complete, _ in _read_records(file.read()):
+                    pass
+            self.data.truncate(complete)
+            self.data.seek(complete)
+        self._reset(self.data.tell())
+
+    def _reset(self, offset: int):
+        self._start = offset
+        self._end = offset
+        self._count = 0
+        self._min = float('inf')
+        self._max = float('-inf')
+        self._routing_keys = set()
+        self._user_ids = set()
+
+    def append(self, record: list):
+        """Append a record, sealing its block once full.
+
+        Args:
+            record (list): occurred_at, routing_key, event, schema_version, message_id and data
+        """
+        frame = _frame(record)
+        self.data.write(frame)
+        self._end += len(frame)
+        self._count += 1
+        self._min = min(self._min, record[0])
+        self._max = max(self._max, record[0])
+        self._routing_keys.add(record[1])
+        if record[5].get('user_id') is not None:
+            self._user_ids.add(record[5]['user_id'])
+        if self._count >= self.block_size:
+            self.seal()
+
+    def seal(self):
+        """Write the pending block, then its index entry.
+        Events written but not indexed yet are scanned by queries.
+        """
+        if not self._count:
+            return
+        self.data.flush()
+        self.index.write(_frame([
+            self._start, self._end, self._min, self._max, sorted(self._routing_keys), sorted(self._user_ids),
+        ]))
+        self.index.flush()
+        self._reset(self._end)
+
+    def close(self):
+        self.seal()
+        self.data.close()
+        self.index.close()
+
+
+class EventStore():
+    """Events partitioned by arrival time, one directory per partition.
+    Every process appends to its own segment of the current partition, so workers
+    never share a file. Closed partitions are immutable until compacted or expired.
+    Events not sealed into a block are lost if the worker crashes, so up to one
+    flush interval of acknowledged events.
+    """
+    def __init__(
+        self,
+        directory: Union[str, None] = None,
+        partition_seconds: Union[int, None] = None,
+        block_size: Union[int, None] = None,
+        retention_seconds: Union[int, None] = None,
+    ):
+        """Initialize the store, segments are opened on the first append.
+
+        Args:
+            directory (str, optional): Store's root. Defaults to EVENT_STORE_DIR
+            partition_seconds (int, optional): Partition length. Defaults to EVENT_STORE_PARTITION_SECONDS
+            block_size (int, optional): Events per indexed block. Defaults to EVENT_STORE_BLOCK_SIZE
+            retention_seconds (int, optional): Age of expired partitions. Defaults to EVENT_STORE_RETENTION_SECONDS
+        """
+        self.directory = directory or os.environ.get('EVENT_STORE_DIR', './events')
+        self.partition_seconds = partition_seconds or int(os.environ.get('EVENT_STORE_PARTITION_SECONDS', 3600))
+        self.block_size = block_size or int(os.environ.get('EVENT_STORE_BLOCK_SIZE', 256))
+        self.retention_seconds = retention_seconds or int(os.environ.get('EVENT_STORE_RETENTION_SECONDS', 7 * 24 * 3600))
+
+        self._partition: Union[int, None] = None
+        self._writer: Union[SegmentWriter, None] = None
+
+    def _partition_path(self, partition: int) -> str:
+        return os.path.join(self.directory, f'{partition:012d}')
+
+    def _partitions(self) -> List[int]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name) for name in os.listdir(self.directory) if name.isdigit())
+
+    def append(self, routing_key: str, event: Event):
+        """Store an event in the current partition.
+
+        Args:
+            routing_key (str): Routing key the event was published with
+            event (Event): Decoded event
+        """
+        partition = int(time.time()) // self.partition_seconds * self.partition_seconds
+        if partition != self._partition:
+            self.close()
+            path = self._partition_path(partition)
+            os.makedirs(path, exist_ok=True)
+            # one segment per worker process and partition
+            name = f'{socket.gethostname()}-{os.getpid()}'
+            self._writer = SegmentWriter(os.path.join(path, name), self.block_size)
+            self._partition = partition
+
+        self._writer.append([
+            event.occurred_at, routing_key, event.type.value, event.schema_version, event.message_id, event.data,
+        ])
+
+    def flush(self):
+        """Seal the pending block, making its events visible through the index.
+        """
+        if self._writer is not None:
+            self._writer.seal()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._partition = None
+
+    def _read_segment(
+        self,
+        path: str,
+        start: float,
+        end: float,
+        routing_key: Union[str, None],
+        user_id: Union[int, None],
+    ) -> Iterator[list]:
+        """Read the blocks of a segment that may match, then its unindexed tail.
+        """
+        try:
+            with open(path + INDEX_SUFFIX, 'rb') as file:
+                blocks = [entry for _, entry in _read_records(file.read())]
+        except FileNotFoundError:
+            blocks = []
+        indexed = blocks[-1][1] if blocks else 0
+
+        with open(path + SEGMENT_SUFFIX, 'rb') as file:
+            for offset, block_end, low, high, routing_keys, user_ids in blocks:
+                if high < start or low >= end:
+                    continue
+                if routing_key is not None and routing_key not in routing_keys:
+                    continue
+                if user_id is not None and user_id not in user_ids:
+                    continue
+                file.seek(offset)
+                for _, record in _read_records(file.read(block_end - offset)):
+                    yield record
+            file.seek(indexed)
+            for _, record in _read_records(file.read()):
+                yield record
+
+    def query(
+        self,
+        start: Union[float, None] = None,
+        end: Union[float, None] = None,
+        routing_key: Union[str, None] = None,
+        user_id: Union[int, None] = None,
+        limit: Union[int, None] = None,
+    ) -> List[dict]:
+        """Return the stored events matching every given filter, by event time.
+        Partitions received before start are skipped, and only matching blocks are read.
+
+        Args:
+            start (float, optional): Event time lower bound, inclusive. Defaults to None
+            end (float, optional): Event time upper bound, exclusive. Defaults to None
+            routing_key (str, optional): Routing key. Defaults to None
+            user_id (int, optional): User id of the event. Defaults to None
+            limit (int, optional): Maximum number of events, the earliest. Defaults to None
+
+        Returns:
+            List[dict]: Matching events
+        """
+        start = float('-inf') if start is None else start
+        end = float('inf') if end is None else end
+        events = []
+        for partition in self._partitions():
+            # an event is received after it occurs
+            if partition + self.partition_seconds <= start:
+                continue
+            path = self._partition_path(partition)
+            for name in sorted(os.listdir(path)):
+                if not name.endswith(SEGMENT_SUFFIX):
+                    continue
+                for record in self._read_segment(os.path.join(path, name[:-len(SEGMENT_SUFFIX)]), start, end, routing_key, user_id):
+                    occurred_at, key, event, schema_version, message_id, data = record
+                    if not start <= occurred_at < end:
+                        continue
+                    if routing_key is not None and key != routing_key:
+                        continue
+                    if user_id is not None and data.get('user_id') != user_id:
+                        continue
+                    events.append({
+                        'occurred_at': occurred_at,
+                        'routing_key': key,
+                        'event': event,
+                        'schema_version': schema_version,
+                        'message_id': message_id,
+                        'data': data,
+                    })
+
+        events.sort(key=lambda event: event['occurred_at'])
+        return events[:limit] if limit is not None else events
+
+    def _sorted_run(self, segment: str, run: str) -> str:
+        """Return a segment's path if sorted by event time, or write a sorted copy of it to run.
+        Only this segment is held in memory.
+        """
+        if _sorted_by_time(segment):
+            return segment
+        with open(segment, 'rb') as file:
+            records = sorted(_stream_records(file), key=lambda record: record[0])
+        with open(run, 'wb') as file:
+            for record in records:
+                file.write(_frame(record))
+        return run
+
+    def _compact(self, partition: int):
+        """Merge the segments of a closed partition into one, sorted by event time.
+        Sorted blocks cover narrow time ranges, so range queries read fewer of them.
+        Each segment is sorted on its own, then every segment is streamed through a merge,
+        so memory is bounded by the largest segment rather than the partition.
+        Events are deduplicated by message id, so an interrupted compaction can be rerun.
+        """
+        path = self._partition_path(partition)
+        names = sorted(name[:-len(SEGMENT_SUFFIX)] for name in os.listdir(path) if name.endswith(SEGMENT_SUFFIX))
+        names = [name for name in names if name != 'compacting']
+        if names == [COMPACTED]:
+            return
+
+        staging = os.path.join(path, 'compacting')
+        for name in os.listdir(path):
+            if name.startswith('compacting'):
+                os.remove(os.path.join(path, name))
+
+        events = 0
+        try:
+            with contextlib.ExitStack() as files:
+                runs = []
+                for index, name in enumerate(names):
+                    run = self._sorted_run(os.path.join(path, name + SEGMENT_SUFFIX), f'{staging}-{index}{RUN_SUFFIX}')
+                    runs.append(_stream_records(files.enter_context(open(run, 'rb'))))
+                writer = SegmentWriter(staging, self.block_size)
+                # copies of an event share its time, so only ids seen at the current time are kept
+                moment, seen = None, set()
+                for record in heapq.merge(*runs, key=lambda record: record[0]):
+                    if record[0] != moment:
+                        moment, seen = record[0], set()
+                    if record[4] in seen:
+                        continue
+                    seen.add(record[4])
+                    writer.append(record)
+                    events += 1
+                writer.close()
+        finally:
+            for name in os.listdir(path):
+                if name.endswith(RUN_SUFFIX):
+                    os.remove(os.path.join(path, name))
+
+        # a segment without index is wholly scanned, so it never pairs with a stale one
+        compacted = os.path.join(path, COMPACTED)
+        if os.path.exists(compacted + INDEX_SUFFIX):
+            os.remove(compacted + INDEX_SUFFIX)
+        os.replace(staging + SEGMENT_SUFFIX, compacted + SEGMENT_SUFFIX)
+        os.replace(staging + INDEX_SUFFIX, compacted + INDEX_SUFFIX)
+        for name in names:
+            if name == COMPACTED:
+                continue
+            for suffix in (SEGMENT_SUFFIX, INDEX_SUFFIX):
+                if os.path.exists(os.path.join(path, name + suffix)):
+                    os.remove(os.path.join(path, name + suffix))
+        logger.info(f'Event store partition {partition} compacted, {events} events in {len(names)} segments.')
+
+    def maintain(self, now: Union[float, None] = None, grace_seconds: float = 60):
+        """Expire partitions older than the retention and compact the other closed ones.
+        Must run in a single process, e.g. the supervisor.
+
+        Args:
+            now (float, optional): Current time. Defaults to time.time()
+            grace_seconds (float, optional): Age of a partition's end before it is considered closed.
+                Covers the time workers take to switch partitions. Defaults to 60
+        """
+        now = time.time() if now is None else now
+        for partition in self._partitions():
+            partition_end = partition + self.partition_seconds
+            if partition_end <= now - self.retention_seconds:
+                shutil.rmtree(self._partition_path(partition), ignore_errors=True)
+                logger.info(f'Event store partition {partition} expired.')
+            elif partition_end <= now - grace_seconds:
+                try:
+                    self._compact(partition)
+                except OSError as exc:
+                    logger.error(f'Event store compaction of partition {partition} failed: {exc!r}')
+
+
+class StoreFlusher():
+    """Seals the store's pending block on a timer of the consumer's connection.
+    Seals run on the consuming thread between callbacks, so no locking is needed.
+    """
+    def __init__(self, store: EventStore, flush_interval: Union[float, None] = None):
+        """Initialize the flusher, the timer is started by start().
+
+        Args:
+            store (EventStore): Store filled by the callbacks
+            flush_interval (float, optional): Seconds between seals. Defaults to EVENT_STORE_FLUSH_INTERVAL
+        """
+        self.store = store
+        self.flush_interval = flush_interval or float(os.environ.get('EVENT_STORE_FLUSH_INTERVAL', 1))
+        self._connection: Union[pika.BlockingConnection, None] = None
+        self._timer = None
+
+    def start(self, connection: pika.BlockingConnection):
+        """Schedule periodic seals on a connection's I/O loop.
+
+        Args:
+            connection (pika.BlockingConnection): Connection dispatching the callbacks
+        """
+        self._connection = connection
+        self._timer = connection.call_later(self.flush_interval, self._on_timer)
+
+    def _on_timer(self):
+        self.store.flush()
+        self._timer = self._connection.call_later(self.flush_interval, self._on_timer)
+
+    def stop(self):
+        """Cancel the timer and close the store's segment.
+        """
+        if self._timer is not None:
+            self._connection.remove_timeout(self._timer)
+            self._timer = None
+        self.store.close()
+
+
+event_store = EventStore()
+
+
+def parse_time(value: str) -> float:
+    """Parse an epoch or an ISO 8601 time, UTC unless it has an offset.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+
+
+def main(argv: Union[Iterable[str], None] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    query = commands.add_parser('query', help='print matching events as JSON lines, by event time')
+    query.add_argument('--from', dest='start', type=parse_time, help='epoch or ISO 8601 time, inclusive')
+    query.add_argument('--to', dest='end', type=parse_time, help='epoch or ISO 8601 time, exclusive')
+    query.add_argument('--routing-key')
+    query.add_argument('--user-id', type=int)
+    query.add_argument('--limit', type=int)
+    commands.add_parser('maintain', help='expire and compact closed partitions')
+    args = parser.parse_args(argv)
+
+    if args.command == 'maintain':
+        event_store.maintain()
+        return
+
+    events = event_store.query(args.start, args.end, args.routing_key, args.user_id, args.limit)
+    for event in events:
+        sys.stdout.write(json.dumps(event, default=str) + '\n')
+
+
+if __name__ == '__main__':
+    main()
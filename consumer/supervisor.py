@@ -0,0 +1,182 @@
+import os
+import signal
+import tempfile
+import time
+from multiprocessing import Process
+from multiprocessing.connection import wait
+from typing import Dict, List, Tuple
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# workers share their metrics through files, set before prometheus_client is imported
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'consumer-metrics'))
+# metrics labelled on import, such as the retry counters, open their file right away
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+from main import QUEUES, consume
+from log import logger
+from metrics import mark_process_dead, reset_multiprocess_dir, start_exporter
+from store import event_store
+
+
+def parse_workers(spec: str) -> List[Tuple[str, ...]]:
+    """Parse the per-queue worker counts.
+
+    Args:
+        spec (str): Comma separated 'queue=count' pairs, e.g. 'order.info=2,user.info=1'
+            Queues joined by '+' share a worker, e.g. 'user.info+user.error=1'
+
+    Raises:
+        ValueError: On unknown queues or invalid counts
+
+    Returns:
+        List[Tuple[str, ...]]: Queues consumed by each worker
+    """
+    workers = []
+    for item in filter(None, (item.strip() for item in spec.split(','))):
+        queues, _, count = item.partition('=')
+        queues = tuple(queue.strip() for queue in queues.split('+'))
+
+        unknown = set(queues) - set(QUEUES)
+        if unknown:
+            raise ValueError(f'Unknown queues: {", ".join(sorted(unknown))}')
+        if int(count or 1) < 0:
+            raise ValueError(f'Invalid worker count for {"+".join(queues)}: {count}')
+
+        workers.extend([queues] * int(count or 1))
+    return workers
+
+
+class Supervisor():
+    """Runs consumer worker processes, each with its own connection and channel.
+    Workers assigned to the same queue are competing consumers.
+    Crashed workers are restarted with an exponential backoff.
+    The event store is expired and compacted periodically, from this process only.
+    """
+    def __init__(
+        self,
+        workers: List[Tuple[str, ...]],
+        max_backoff: float = 30,
+        stable_after: float = 60,
+        maintenance_interval: float = 300,
+    ):
+        """Initialize the supervisor without starting any worker.
+
+        Args:
+            workers (List[Tuple[str, ...]]): Queues consumed by each worker
+            max_backoff (float, optional): Maximum restart delay in seconds. Defaults to 30.
+            stable_after (float, optional): Uptime in seconds resetting the backoff. Defaults to 60.
+            maintenance_interval (float, optional): Seconds between event store maintenances. Defaults to 300.
+        """
+        self.workers = workers
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.maintenance_interval = maintenance_interval
+        self._maintain_at = time.monotonic() + maintenance_interval
+
+        self._processes: Dict[int, Process] = {}
+        self._started_at: Dict[int, float] = {}
+        self._failures: Dict[int, int] = {slot: 0 for slot in range(len(workers))}
+        self._restart_at: Dict[int, float] = {}
+        self._stopping = False
+
+    def _spawn(self, slot: int):
+        queues = self.workers[slot]
+        process = Process(target=consume, args=(queues,), name=f'consumer-{slot}-{"+".join(queues)}')
+        process.start()
+
+        self._processes[slot] = process
+        self._started_at[slot] = time.monotonic()
+        logger.info(f'Worker {process.name} started with pid {process.pid}.')
+
+    def _reap(self):
+        """Schedule the restart of every exited worker.
+        """
+        now = time.monotonic()
+        for slot, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self._processes[slot]
+            mark_process_dead(process.pid)
+
+            if now - self._started_at[slot] >= self.stable_after:
+                self._failures[slot] = 0
+            delay = min(self.max_backoff, 2 ** self._failures[slot] - 1)
+            self._failures[slot] += 1
+            self._restart_at[slot] = now + delay
+
+            logger.error(f'Worker {process.name} exited with code {process.exitcode}, restarting in {delay}s.')
+
+    def _restart_due(self):
+        now = time.monotonic()
+        for slot, restart_at in list(self._restart_at.items()):
+            if restart_at <= now:
+                del self._restart_at[slot]
+                self._spawn(slot)
+
+    def _maintain_due(self):
+        if time.monotonic() < self._maintain_at:
+            return
+        try:
+            event_store.maintain()
+        except OSError as exc:
+            logger.error(f'Event store maintenance failed: {exc!r}')
+        self._maintain_at = time.monotonic() + self.maintenance_interval
+
+    def stop(self, signum=None, frame=None):
+        """Ask the supervision loop to stop, usable as a signal handler.
+        """
+        del signum, frame
+        self._stopping = True
+
+    def forward(self, signum, frame=None):
+        """Send a signal to every running worker, usable as a signal handler.
+        """
+        del frame
+        for process in self._processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    def run(self, shutdown_timeout: float = 30):
+        """Start every worker and supervise them until stop() is called.
+
+        Args:
+            shutdown_timeout (float, optional): Seconds waiting for workers to exit. Defaults to 30.
+        """
+        for slot in range(len(self.workers)):
+            self._spawn(slot)
+
+        while not self._stopping:
+            wait([process.sentinel for process in self._processes.values()], timeout=1)
+            if self._stopping:
+                break
+            self._reap()
+            self._restart_due()
+            self._maintain_due()
+
+        for process in self._processes.values():
+            process.terminate()
+        deadline = time.monotonic() + shutdown_timeout
+        for process in self._processes.values():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+        logger.info('Supervisor stopped.')
+
+
+if __name__ == '__main__':
+    reset_multiprocess_dir()
+    start_exporter(int(os.environ.get('CONSUMER_METRICS_PORT', 9100)))
+
+    supervisor = Supervisor(
+        parse_workers(os.environ.get('CONSUMER_WORKERS', '=1,'.join(QUEUES) + '=1')),
+        maintenance_interval=float(os.environ.get('EVENT_STORE_MAINTENANCE_INTERVAL', 300)),
+    )
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    signal.signal(signal.SIGINT, supervisor.stop)
+    # switches profiling on or off in every worker
+    signal.signal(signal.SIGUSR1, supervisor.forward)
+    supervisor.run()
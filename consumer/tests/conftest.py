@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# read when the log module is first imported
+os.environ.setdefault('LOG_DIR', tempfile.mkdtemp(prefix='consumer-tests-'))
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pika
+import pytest
+
+from retry import ATTEMPT_HEADER, ERROR_HEADER, ROUTING_KEY_HEADER, RetryPolicy
+
+
+class Channel():
+    """Records what a policy declares and publishes."""
+    def __init__(self):
+        self.queues = {}
+        self.bindings = []
+        self.published = []
+
+    def exchange_declare(self, exchange, exchange_type, durable):
+        pass
+
+    def queue_declare(self, queue, durable, arguments=None):
+        self.queues[queue] = arguments
+
+    def queue_bind(self, exchange, queue, routing_key):
+        self.bindings.append((exchange, queue, routing_key))
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append((exchange, routing_key, body, properties))
+
+
+def deliver(handler, headers=None, routing_key='order.info.1'):
+    channel = Channel()
+    properties = pika.BasicProperties(message_id='m1', headers=headers)
+    handler(channel, SimpleNamespace(routing_key=routing_key), properties, b'body')
+    return channel
+
+
+def failing(ch, method, properties, body):
+    raise RuntimeError('downstream failed')
+
+
+def test_delay_queues_double_up_to_max_attempts():
+    policy = RetryPolicy(max_attempts=4, base_delay_ms=100)
+    assert policy.delays_ms == [100, 200, 400]
+    assert [policy.delay_queue('order.info', attempt) for attempt in (1, 2, 3)] == [
+        'order.info.retry.100ms', 'order.info.retry.200ms', 'order.info.retry.400ms',
+    ]
+
+    channel = Channel()
+    policy.declare(channel, 'order.info')
+    assert channel.queues['order.info.retry.200ms'] == {
+        'x-message-ttl': 200, 'x-dead-letter-exchange': '', 'x-dead-letter-routing-key': 'order.info',
+    }
+    assert ('producer_log.dlx', 'order.info.dlq', 'order.info') in channel.bindings
+
+
+def test_success_publishes_nothing():
+    handler = RetryPolicy(max_attempts=3, base_delay_ms=100)('order.info')(lambda *args: None)
+    assert deliver(handler).published == []
+
+
+@pytest.mark.parametrize('attempt, queue', [(1, 'order.info.retry.100ms'), (2, 'order.info.retry.200ms')])
+def test_failure_is_delayed_with_the_next_attempt(attempt, queue):
+    handler = RetryPolicy(max_attempts=3, base_delay_ms=100)('order.info')(failing)
+    headers = {ATTEMPT_HEADER: attempt, ROUTING_KEY_HEADER: 'order.info.1'} if attempt > 1 else None
+
+    (exchange, routing_key, body, properties), = deliver(handler, headers).published
+    assert (exchange, routing_key, body) == ('', queue, b'body')
+    assert properties.headers[ATTEMPT_HEADER] == attempt + 1
+    assert properties.headers[ROUTING_KEY_HEADER] == 'order.info.1'
+    assert 'downstream failed' in properties.headers[ERROR_HEADER]
+
+
+def test_last_failure_is_dead_lettered():
+    handler = RetryPolicy(max_attempts=3, base_delay_ms=100)('order.info')(failing)
+
+    (exchange, routing_key, body, properties), = deliver(handler, {ATTEMPT_HEADER: 3}).published
+    assert (exchange, routing_key) == ('producer_log.dlx', 'order.info')
+    assert properties.headers[ATTEMPT_HEADER] == 3
+
+
+def test_redelivery_restores_the_original_routing_key():
+    received = []
+    handler = RetryPolicy(max_attempts=3, base_delay_ms=100)('order.info')(
+        lambda ch, method, properties, body: received.append(method.routing_key),
+    )
+    # delay queues dead-letter through the default exchange, keyed by the queue's name
+    deliver(handler, {ATTEMPT_HEADER: 2, ROUTING_KEY_HEADER: 'order.info.1'}, routing_key='order.info')
+    assert received == ['order.info.1']
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from common.codec import Event, EventType
+from store import COMPACTED, INDEX_SUFFIX, SEGMENT_SUFFIX, EventStore, SegmentWriter, _stream_records
+
+
+PARTITION = 1700000000 // 3600 * 3600
+
+
+def order(message_id: str, occurred_at: float, user_id: int) -> Event:
+    return Event(
+        EventType.ORDER_CREATED,
+        {'order_id': 1, 'user_id': user_id, 'details': message_id},
+        message_id=message_id,
+        occurred_at=occurred_at,
+    )
+
+
+def record(message_id: str, occurred_at: float, user_id: int, routing_key: str = 'order.info.0') -> list:
+    event = order(message_id, occurred_at, user_id)
+    return [occurred_at, routing_key, event.type.value, event.schema_version, event.message_id, event.data]
+
+
+def write_segment(store: EventStore, name: str, records: list):
+    path = os.path.join(store.directory, f'{PARTITION:012d}')
+    os.makedirs(path, exist_ok=True)
+    writer = SegmentWriter(os.path.join(path, name), store.block_size)
+    for item in records:
+        writer.append(item)
+    writer.close()
+
+
+@pytest.fixture
+def store(tmp_path) -> EventStore:
+    return EventStore(directory=str(tmp_path), partition_seconds=3600, block_size=2)
+
+
+def test_query_filters_sealed_events(store):
+    for index in range(5):
+        store.append('order.info.1' if index % 2 else 'order.info.0', order(f'm{index}', PARTITION + index, user_id=index % 2))
+
+    ids = lambda events: [event['message_id'] for event in events]
+    # the fifth event waits in the writer's pending block until flushed
+    assert ids(store.query()) == ['m0', 'm1', 'm2', 'm3']
+    store.flush()
+    assert ids(store.query()) == ['m0', 'm1', 'm2', 'm3', 'm4']
+    assert ids(store.query(start=PARTITION + 1, end=PARTITION + 4)) == ['m1', 'm2', 'm3']
+    assert ids(store.query(routing_key='order.info.1')) == ['m1', 'm3']
+    assert ids(store.query(user_id=0)) == ['m0', 'm2', 'm4']
+    assert ids(store.query(user_id=0, limit=2)) == ['m0', 'm2']
+    assert store.query(start=PARTITION + 3600) == []
+    store.close()
+
+
+@pytest.mark.parametrize('block_size', [1, 2, 100])
+def test_compaction_merges_segments_by_time(tmp_path, block_size):
+    store = EventStore(directory=str(tmp_path), partition_seconds=3600, block_size=block_size)
+    write_segment(store, 'worker-1', [record('a', PARTITION + 5, 1), record('b', PARTITION + 1, 2), record('c', PARTITION + 3, 1)])
+    write_segment(store, 'worker-2', [record('d', PARTITION + 2, 2), record('e', PARTITION + 4, 1, 'order.info.1')])
+    before = store.query()
+
+    store.maintain(now=PARTITION + 2 * 3600)
+
+    path = os.path.join(store.directory, f'{PARTITION:012d}')
+    assert sorted(os.listdir(path)) == [COMPACTED + INDEX_SUFFIX, COMPACTED + SEGMENT_SUFFIX]
+    with open(os.path.join(path, COMPACTED + SEGMENT_SUFFIX), 'rb') as file:
+        assert [item[4] for item in _stream_records(file)] == ['b', 'd', 'c', 'e', 'a']
+    assert store.query() == before
+    assert [event['message_id'] for event in store.query(user_id=1, start=PARTITION + 4)] == ['e', 'a']
+
+
+def test_rerun_compaction_drops_duplicates(store):
+    # an interrupted compaction leaves the compacted segment next to the segments it copied
+    write_segment(store, COMPACTED, [record('a', PARTITION + 1, 1), record('b', PARTITION + 2, 1)])
+    write_segment(store, 'worker-1', [record('b', PARTITION + 2, 1), record('c', PARTITION + 2, 1)])
+
+    store.maintain(now=PARTITION + 2 * 3600)
+    assert [event['message_id'] for event in store.query()] == ['a', 'b', 'c']
+
+
+def test_open_partitions_are_left_alone_and_old_ones_expire(store):
+    write_segment(store, 'worker-1', [record('a', PARTITION + 1, 1)])
+
+    # still within the grace period of workers switching partitions
+    store.maintain(now=PARTITION + 3600)
+    assert 'worker-1' + SEGMENT_SUFFIX in os.listdir(os.path.join(store.directory, f'{PARTITION:012d}'))
+
+    store.maintain(now=PARTITION + 3600 + store.retention_seconds)
+    assert store.query() == []
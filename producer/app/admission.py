@@ -0,0 +1,245 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, Tuple, Union
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.metrics import ADMISSION_LIMIT, ADMISSION_REJECTED, observe_stage
+
+
+# stages whose latency reflects the saturation of PostgreSQL, requests reach RabbitMQ through the outbox
+DOWNSTREAM_STAGES = ('db_commit',)
+
+# route name, its endpoint's by default: (maximum concurrent requests, stages adapting the limit)
+# every path of an endpoint shares its limit
+ROUTE_LIMITS: Dict[str, Tuple[int, Tuple[str, ...]]] = {
+    'create_user': (64, DOWNSTREAM_STAGES),
+    'create_order': (64, DOWNSTREAM_STAGES),
+    'create_orders': (8, DOWNSTREAM_STAGES),
+    'login': (64, ()),
+    'list_users': (64, ()),
+    'get_user': (128, ()),
+    'list_orders': (64, ()),
+    'get_order': (128, ()),
+    'export_orders': (4, ()),
+}
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """Parse per-route limit overrides.
+
+    Args:
+        spec (str): Comma separated 'route=limit' pairs, e.g. 'create_orders=4'
+
+    Raises:
+        ValueError: On unknown routes or invalid limits
+
+    Returns:
+        Dict[str, int]: Maximum concurrent requests by route
+    """
+    limits = {}
+    for item in filter(None, (item.strip() for item in spec.split(','))):
+        route, _, limit = item.rpartition('=')
+        if route not in ROUTE_LIMITS:
+            raise ValueError(f'Unknown route: {route}')
+        if int(limit) < 1:
+            raise ValueError(f'Invalid limit for {route}: {limit}')
+        limits[route] = int(limit)
+    return limits
+
+
+class AdaptiveLimit():
+    """Concurrency limit adjusted by additive increase, multiplicative decrease.
+    A sample slower than the target shrinks the limit, at most once per cooldown,
+    while a full limit's worth of fast samples grows it by one.
+    """
+    def __init__(self, maximum: int, target: float, minimum: int = 1, decrease: float = 0.75, cooldown: float = 1):
+        """Start at the maximum.
+
+        Args:
+            maximum (int): Upper bound, and initial value
+            target (float): Latency in seconds above which the limit shrinks
+            minimum (int, optional): Lower bound. Defaults to 1.
+            decrease (float, optional): Factor applied on a slow sample. Defaults to 0.75.
+            cooldown (float, optional): Seconds between two decreases. Defaults to 1.
+        """
+        self.maximum = maximum
+        self.minimum = minimum
+        self.target = target
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.value = maximum
+
+        self._fast = 0
+        self._decreased_at = float('-inf')
+        self._lock = threading.Lock()
+
+    @property
+    def saturated(self) -> bool:
+        """Whether the limit was lowered below its maximum.
+        """
+        return self.value < self.maximum
+
+    def observe(self, latency: float):
+        """Adjust the limit to a latency sample, safe to call from any thread.
+        """
+        with self._lock:
+            if latency > self.target:
+                now = time.monotonic()
+                if now - self._decreased_at >= self.cooldown:
+                    self.value = max(self.minimum, math.floor(self.value * self.decrease))
+                    self._decreased_at = now
+                self._fast = 0
+            elif self.value < self.maximum:
+                self._fast += 1
+                if self._fast >= self.value:
+                    self.value += 1
+                    self._fast = 0
+
+
+class RouteLimiter():
+    """Admits a route's requests up to its limit, queueing a bounded number of others.
+    Runs on the event loop only, the limit itself may change from any thread.
+    """
+    def __init__(self, route: str, limit: AdaptiveLimit, queue_size: int, max_wait: float):
+        """Initialize an idle limiter.
+
+        Args:
+            route (str): Route name, used as label
+            limit (AdaptiveLimit): Concurrency limit
+            queue_size (int): Requests waiting for a slot, others are rejected at once
+            max_wait (float): Seconds a queued request waits before being rejected
+        """
+        self.route = route
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> Union[int, None]:
+        """Wait for a slot.
+
+        Returns:
+            int | None: None once admitted, otherwise the rejection's status code
+                429 when the route is at its maximum, 503 when downstream slowness lowered it
+        """
+        ADMISSION_LIMIT.labels(self.route).set(self.limit.value)
+        if self.in_flight < self.limit.value and not self._waiters:
+            self.in_flight += 1
+            return None
+
+        rejection = status.HTTP_503_SERVICE_UNAVAILABLE if self.limit.saturated else status.HTTP_429_TOO_MANY_REQUESTS
+        if len(self._waiters) >= self.queue_size:
+            return rejection
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # release() counts the slot as taken before resolving the waiter
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            return rejection
+        except asyncio.CancelledError:
+            # the client left, possibly right after being handed a slot
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter.cancelled() and waiter in self._waiters:
+                self._waiters.remove(waiter)
+        return None
+
+    def release(self):
+        """Free a slot, handing over as many as the limit allows to queued requests.
+        """
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < self.limit.value:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+
+class AdmissionMiddleware():
+    """ASGI middleware shedding load before requests reach the threadpool or a DB session.
+    Each route of ROUTE_LIMITS has its own limiter, adapted to the latency of its
+    downstream stages. Other routes, such as health checks and metrics, are never limited.
+    """
+    def __init__(
+        self,
+        app: ASGIApp,
+        limits: Union[Dict[str, int], None] = None,
+        queue_size: Union[int, None] = None,
+        max_wait_ms: Union[float, None] = None,
+        target_ms: Union[float, None] = None,
+        retry_after: Union[int, None] = None,
+    ):
+        """Initialize a limiter per route, unset arguments are read from the environment.
+
+        Args:
+            app (ASGIApp): Wrapped application
+            limits (Dict[str, int], optional): Limit overrides by route. Defaults to ADMISSION_LIMITS
+            queue_size (int, optional): Queued requests per route. Defaults to ADMISSION_QUEUE_SIZE
+            max_wait_ms (float, optional): Queueing time limit. Defaults to ADMISSION_MAX_WAIT_MS
+            target_ms (float, optional): Downstream latency target. Defaults to ADMISSION_TARGET_MS
+            retry_after (int, optional): Retry-After of rejections, in seconds. Defaults to ADMISSION_RETRY_AFTER
+        """
+        self.app = app
+        limits = parse_limits(os.environ.get('ADMISSION_LIMITS', '')) if limits is None else limits
+        queue_size = queue_size or int(os.environ.get('ADMISSION_QUEUE_SIZE', 32))
+        max_wait = (max_wait_ms or float(os.environ.get('ADMISSION_MAX_WAIT_MS', 500))) / 1000
+        target = (target_ms or float(os.environ.get('ADMISSION_TARGET_MS', 250))) / 1000
+        self.retry_after = str(retry_after or int(os.environ.get('ADMISSION_RETRY_AFTER', 1)))
+
+        self.limiters: Dict[str, RouteLimiter] = {}
+        for route, (maximum, stages) in ROUTE_LIMITS.items():
+            limit = AdaptiveLimit(limits.get(route, maximum), target)
+            for stage in stages:
+                observe_stage(stage, limit.observe)
+            self.limiters[route] = RouteLimiter(route, limit, queue_size, max_wait)
+
+    @staticmethod
+    def _route(scope: Scope, routes: Iterable) -> Union[str, None]:
+        """Match the request against the application's routes, as the router will, returning the route's name.
+        The matched route is stored in the scope, so metrics and profiles are labelled by template.
+        """
+        for route in routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                scope['route'] = child_scope.get('route', route)
+                return getattr(scope['route'], 'name', None)
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiters.get(self._route(scope, scope['app'].router.routes))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        rejection = await limiter.acquire()
+        if rejection is not None:
+            ADMISSION_REJECTED.labels(limiter.route, rejection).inc()
+            response = JSONResponse(
+                status_code=rejection,
+                content={'detail': f'{limiter.route} is overloaded, retry later'},
+                headers={'Retry-After': self.retry_after},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
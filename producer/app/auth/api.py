@@ -3,6 +3,9 @@ from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_async_db
 
 from .utils import authenticate_user, create_access_token
 from .schema import Token
@@ -14,7 +17,10 @@ auth_router = APIRouter(
 )
 
 @auth_router.post('/token', response_model=Token)
-def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
+async def login(
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    db: Annotated[AsyncSession, Depends(get_async_db)],
+):
     """Authenticate and create an access token for an user.
 
     Args:
@@ -26,7 +32,7 @@ def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
     Returns:
         dict: access token data
     """
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -36,7 +42,7 @@ def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={'sub': user.email}, expires_delta=access_token_expires
+        data={'sub': user.email, 'uid': user.id}, expires_delta=access_token_expires
     )
 
     return {
@@ -4,3 +4,7 @@ import os
 SECRET_KEY = os.environ.get('SECRET_KEY', 'secret')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+
+# decoded tokens and resolved users, kept per process
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 10000))
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', 300))
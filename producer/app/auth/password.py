@@ -0,0 +1,150 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from typing import Callable, Tuple, Union
+
+from passlib.context import CryptContext
+
+from app.metrics import timed
+
+
+class PasswordHasherBusy(Exception):
+    """Too many password operations are already queued."""
+
+
+@lru_cache(maxsize=None)
+def crypt_context(rounds: int) -> CryptContext:
+    """Return the bcrypt context of a cost, built once per process.
+    Hashes of any other cost are reported as needing an update.
+
+    Args:
+        rounds (int): bcrypt cost factor
+
+    Returns:
+        CryptContext: Password context
+    """
+    return CryptContext(
+        schemes=['bcrypt'],
+        deprecated='auto',
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+def _hash(password: str, rounds: int) -> str:
+    return crypt_context(rounds).hash(password)
+
+
+def _verify(password: str, password_hash: str, rounds: int) -> Tuple[bool, Union[str, None]]:
+    return crypt_context(rounds).verify_and_update(password, password_hash)
+
+
+def _warm(rounds: int) -> int:
+    crypt_context(rounds)
+    return os.getpid()
+
+
+class PasswordHasher():
+    """Runs bcrypt in a dedicated, size limited process pool.
+    Keeps CPU heavy authentication off the request threadpool and the GIL,
+    rejecting new work once max_pending operations are queued or running.
+    """
+    def __init__(
+        self,
+        workers: Union[int, None] = None,
+        max_pending: Union[int, None] = None,
+        rounds: Union[int, None] = None,
+    ):
+        """Initialize the hasher, the process pool is started on first use.
+
+        Args:
+            workers (int, optional): Worker processes. Defaults to PASSWORD_WORKERS
+            max_pending (int, optional): Admission limit. Defaults to PASSWORD_MAX_PENDING
+            rounds (int, optional): bcrypt cost factor. Defaults to BCRYPT_ROUNDS
+        """
+        self.workers = workers or int(os.environ.get('PASSWORD_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+        self.max_pending = max_pending or int(os.environ.get('PASSWORD_MAX_PENDING', 64))
+        self.rounds = rounds or int(os.environ.get('BCRYPT_ROUNDS', 12))
+
+        self._executor: Union[ProcessPoolExecutor, None] = None
+        self._admission = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process running threads and an event loop isn't safe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self._executor
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        """Queue an operation on the pool, if admitted.
+
+        Raises:
+            PasswordHasherBusy: If max_pending operations are already queued
+
+        Returns:
+            Future: Operation result
+        """
+        if not self._admission.acquire(blocking=False):
+            raise PasswordHasherBusy(f'{self.max_pending} password operations pending')
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._admission.release()
+            raise
+        future.add_done_callback(lambda _: self._admission.release())
+        return future
+
+    async def hash_async(self, password: str) -> str:
+        """Hash a password without blocking the event loop.
+
+        Args:
+            password (str): Plain password
+
+        Returns:
+            str: bcrypt hash
+        """
+        with timed('bcrypt_hash'):
+            return await asyncio.wrap_future(self._submit(_hash, password, self.rounds))
+
+    async def verify_async(self, password: str, password_hash: str) -> Tuple[bool, Union[str, None]]:
+        """Verify a password against its hash without blocking the event loop.
+
+        Args:
+            password (str): Plain password
+            password_hash (str): Stored bcrypt hash
+
+        Returns:
+            Tuple[bool, str | None]: Whether it matches, and a new hash if the cost changed
+        """
+        with timed('bcrypt_verify'):
+            return await asyncio.wrap_future(self._submit(_verify, password, password_hash, self.rounds))
+
+    async def warm_async(self):
+        """Start the worker processes and build their crypt context ahead of the first request.
+        Bypasses admission control, it only runs once per process on startup.
+        """
+        executor = self._get_executor()
+        await asyncio.gather(*(
+            asyncio.wrap_future(executor.submit(_warm, self.rounds))
+            for _ in range(self.workers)
+        ))
+
+    def shutdown(self):
+        """Stop the worker processes.
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+password_hasher = PasswordHasher()
@@ -1,26 +1,58 @@
+import time
 from datetime import timedelta, datetime
 from typing import Annotated
 
 from jose import jwt, JWTError
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import SessionLocal
+from app.cache import TTLCache
+from app.rmq_connector import cache_invalidator
+from app.database import get_async_db
+from app.metrics import timed
 from app.user.model import User
-from .constant import SECRET_KEY, ALGORITHM
+from app.user.schema import UserSchema
+from .password import password_hasher
+from .constant import SECRET_KEY, ALGORITHM, AUTH_CACHE_SIZE, AUTH_CACHE_TTL
 from .schema import TokenData
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 
+# token -> TokenData, email -> UserSchema
+token_cache = TTLCache(max_size=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+user_cache = cache_invalidator.register('auth.user', TTLCache(max_size=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL))
 
-def authenticate_user(email: str, password: str):
-    user = get_user(email)
-    if not user or not user.verify_password(password):
+
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await get_user(db, email)
+    if not user:
+        return False
+
+    valid, new_hash = await password_hasher.verify_async(password, user.password)
+    if not valid:
         return False
+    if new_hash is not None:
+        await update_password_hash(db, user, new_hash)
     return user
 
 
+async def update_password_hash(db: AsyncSession, user: User, password_hash: str):
+    """Store a password hash recomputed with the current bcrypt cost.
+
+    Args:
+        db (AsyncSession): Database session
+        user (User): Authenticated user
+        password_hash (str): New bcrypt hash
+    """
+    await db.execute(update(User).where(User.id == user.id).values(password=password_hash))
+    with timed('db_commit'):
+        await db.commit()
+    await invalidate_user(user.email)
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
@@ -32,31 +64,94 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     return encoded_jwt
 
 
-def get_user(email: str) -> User:
-    try:
-        db = SessionLocal()
-        user = db.query(User).filter(User.email == email).first()
-    finally:
-        db.close()
+async def get_user(db: AsyncSession, email: str) -> User | None:
+    return await db.scalar(select(User).where(User.email == email))
+
+
+async def get_cached_user(db: AsyncSession, email: str) -> UserSchema | None:
+    """Return a user by email, querying the database only on a cache miss.
+    A snapshot is cached rather than the ORM instance, which its session would expire on rollback.
+
+    Args:
+        db (AsyncSession): Database session, used on a cache miss
+        email (str): User email
+
+    Returns:
+        UserSchema | None: User snapshot, if registered
+    """
+    user = user_cache.get(email)
+    if user is None:
+        instance = await get_user(db, email)
+        if instance is not None:
+            user = UserSchema.model_validate(instance, from_attributes=True)
+            user_cache.set(email, user)
     return user
 
 
-def get_current_active_user(token: Annotated[str, Depends(oauth2_scheme)]):
+async def invalidate_user(email: str):
+    """Drop a user from the cache of every replica, to be called whenever the user changes or is removed.
+
+    Args:
+        email (str): User email
+    """
+    await cache_invalidator.invalidate('auth.user', email)
+
+
+def invalidate_token(token: str):
+    """Drop a decoded token from the cache.
+
+    Args:
+        token (str): Encoded access token
+    """
+    token_cache.invalidate(token)
+
+
+def decode_token(token: str) -> TokenData | None:
+    """Decode and validate an access token, caching the result until it expires.
+
+    Args:
+        token (str): Encoded access token
+
+    Returns:
+        TokenData | None: Token claims, or None if invalid
+    """
+    token_data = token_cache.get(token)
+    if token_data is not None:
+        return token_data
+
+    try:
+        with timed('jwt_decode'):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    email: str = payload.get('sub')
+    if email is None:
+        return None
+
+    token_data = TokenData(email=email, user_id=payload.get('uid'))
+    ttl = min(token_cache.ttl, payload['exp'] - time.time()) if 'exp' in payload else None
+    token_cache.set(token, token_data, ttl=ttl)
+    return token_data
+
+
+async def get_current_active_user(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: Annotated[AsyncSession, Depends(get_async_db)],
+):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail='Could not validate credentials',
         headers={'WWW-Authenticate': 'Bearer'},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get('sub')
-        if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email)
-    except JWTError:
+    token_data = decode_token(token)
+    if token_data is None:
         raise credentials_exception
-    current_user = get_user(email=token_data.email)
+    current_user = await get_cached_user(db, email=token_data.email)
     if current_user is None:
         raise credentials_exception
+    if token_data.user_id is not None and token_data.user_id != current_user.id:
+        # the email now belongs to another account
+        await invalidate_user(token_data.email)
+        raise credentials_exception
 
     return current_user
@@ -0,0 +1,76 @@
+from typing import List, Tuple, Union
+
+from sqlalchemy import Column, DateTime, String, Table, func, select, text
+from sqlalchemy.engine import Engine
+
+from app import logger
+from app.database import Base, get_engine
+
+# import all model files for database recognition
+from app.user import model
+from app.order import model
+from app.outbox import model
+
+
+# names of the migrations applied to the database
+schema_migration = Table(
+    'schema_migration',
+    Base.metadata,
+    Column('name', String(128), primary_key=True),
+    Column('applied_at', DateTime, server_default=func.now(), nullable=False),
+)
+
+# (name, statements), applied once each and in order
+# create_all only creates missing tables, so indexes and columns added to existing tables
+# must be listed here, written to also succeed on a database created with them
+MIGRATIONS: List[Tuple[str, Tuple[str, ...]]] = [
+    ('0001_order_keyset_indexes', (
+        'CREATE INDEX IF NOT EXISTS ix_order_created_at_id ON "order" (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_order_created_by_created_at_id ON "order" (created_by, created_at, id)',
+    )),
+]
+
+
+def migrate(engine: Engine) -> List[str]:
+    """Apply the migrations not recorded yet, each in its own transaction.
+
+    Args:
+        engine (Engine): Migrated database
+
+    Returns:
+        List[str]: Names of the applied migrations
+    """
+    with engine.connect() as connection:
+        applied = set(connection.scalars(select(schema_migration.c.name)))
+
+    migrated = []
+    for name, statements in MIGRATIONS:
+        if name in applied:
+            continue
+        with engine.begin() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+            connection.execute(schema_migration.insert().values(name=name))
+        logger.info(f'Migration {name} applied.')
+        migrated.append(name)
+    return migrated
+
+
+def bootstrap(engine: Union[Engine, None] = None):
+    """Create the missing tables, then apply the pending migrations.
+    Run once per deployment, before the API and the outbox relay start.
+
+    Args:
+        engine (Engine, optional): Database to bootstrap. Defaults to get_engine()
+    """
+    engine = engine or get_engine()
+    try:
+        Base.metadata.create_all(bind=engine)
+        migrate(engine)
+    finally:
+        engine.dispose()
+    logger.info('Database schema ready.')
+
+
+if __name__ == '__main__':
+    bootstrap()
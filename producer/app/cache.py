@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Tuple, Union
+
+
+# records read by id and kept per process, users and orders never change once created
+READ_CACHE_SIZE = int(os.environ.get('READ_CACHE_SIZE', 10000))
+READ_CACHE_TTL = float(os.environ.get('READ_CACHE_TTL', 60))
+
+class TTLCache():
+    """Thread-safe, size bounded LRU cache whose entries expire after a time to live.
+    """
+    def __init__(self, max_size: int, ttl: float):
+        """Initialize an empty cache.
+
+        Args:
+            max_size (int): Maximum number of entries, least recently used are evicted first
+            ttl (float): Default time to live of an entry in seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # a disabled cache misses every lookup and stores nothing
+        self.enabled = True
+
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a cached value, or default if missing or expired.
+
+        Args:
+            key (Hashable): Entry key
+            default (Any, optional): Value returned on a miss. Defaults to None.
+
+        Returns:
+            Any: Cached value
+        """
+        if not self.enabled:
+            self.misses += 1
+            return default
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Union[float, None] = None):
+        """Store a value, evicting the least recently used entry if full.
+
+        Args:
+            key (Hashable): Entry key
+            value (Any): Value to be cached
+            ttl (float, optional): Time to live in seconds. Defaults to None
+                If None, the cache's default is used.
+        """
+        if not self.enabled:
+            return
+
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Remove an entry, if present.
+
+        Args:
+            key (Hashable): Entry key
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry.
+        """
+        with self._lock:
+            self._data.clear()
+
+
+# named caches of the process, reported by /health/cache and the cache_* metrics
+_caches: Dict[str, TTLCache] = {}
+
+def named_cache(name: str, cache: TTLCache) -> TTLCache:
+    """Report a cache's size, hits and misses under a name.
+
+    Args:
+        name (str): Cache name
+        cache (TTLCache): Reported cache
+
+    Returns:
+        TTLCache: The named cache
+    """
+    _caches[name] = cache
+    return cache
+
+def cache_stats() -> Dict[str, dict]:
+    """Return the size, hits and misses of every named cache.
+    """
+    return {
+        name: {'size': len(cache), 'hits': cache.hits, 'misses': cache.misses, 'enabled': cache.enabled}
+        for name, cache in _caches.items()
+    }
@@ -0,0 +1,118 @@
+import asyncio
+import os
+from typing import Union
+
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+
+from app.database import get_async_engine
+from app.cache import cache_stats
+from app.rmq_connector import cache_invalidator
+from app.auth.password import password_hasher
+from . import logger
+
+
+health_router = APIRouter(
+    prefix='/health',
+    tags=['Health']
+)
+
+READY_TIMEOUT = float(os.environ.get('READY_TIMEOUT', 2))
+WARM_UP_MAX_DELAY = float(os.environ.get('WARM_UP_MAX_DELAY', 30))
+
+
+async def _ping_database():
+    async with get_async_engine().connect() as connection:
+        await connection.execute(text('SELECT 1'))
+
+
+async def _database_ready() -> bool:
+    try:
+        await asyncio.wait_for(_ping_database(), timeout=READY_TIMEOUT)
+        return True
+    except Exception:
+        return False
+
+
+class WarmUp():
+    """Opens the process' backend connections in the background.
+    The server accepts connections immediately, /health/ready reports once the database
+    is reachable and the password hasher is warm. Requests never publish to RabbitMQ,
+    events are relayed from the outbox, so the broker doesn't hold readiness back.
+    """
+    def __init__(self):
+        self.done = False
+        self._task: Union[asyncio.Task, None] = None
+
+    async def _attempt(self):
+        await _ping_database()
+        await password_hasher.warm_async()
+
+    async def _run(self):
+        """Retry the warm-up until it succeeds, doubling the delay between failures up to WARM_UP_MAX_DELAY.
+        """
+        delay = 0.5
+        while True:
+            try:
+                await self._attempt()
+                break
+            except Exception as exc:
+                logger.warning(f'Producer warm-up failed, retrying in {delay}s: {exc!r}')
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, WARM_UP_MAX_DELAY)
+        self.done = True
+        logger.info('Producer ready.')
+
+    def start(self):
+        """Schedule the warm-up on the running event loop.
+        """
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancel an unfinished warm-up.
+        """
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+
+warm_up = WarmUp()
+
+
+@health_router.get('/live')
+async def live():
+    """Report that the process serves requests, without touching any backend.
+    """
+    return {'status': 'alive'}
+
+@health_router.get('/ready')
+async def ready():
+    """Report whether the process is warm and its database is reachable.
+    RabbitMQ is reported, as the cache invalidator's subscription, without affecting
+    readiness: events wait in the outbox while it is unreachable.
+
+    Returns:
+        JSONResponse: 200 when ready, 503 otherwise
+    """
+    checks = {'warm_up': warm_up.done, 'database': False}
+    if warm_up.done:
+        checks['database'] = await _database_ready()
+
+    ready = all(checks.values())
+    checks['rabbitmq'] = cache_invalidator.subscribed
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={'status': 'ready' if ready else 'unavailable', 'checks': checks},
+    )
+
+@health_router.get('/cache')
+async def cache_stats():
+    """Report size, hits and misses of the read caches.
+    Caches evicted across replicas are disabled, missing every lookup, while evictions aren't received.
+    """
+    return {'subscribed': cache_invalidator.subscribed, 'caches': cache_stats()}
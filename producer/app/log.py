@@ -0,0 +1,7 @@
+import logging
+
+from common.log import start_pipeline
+
+
+logger = logging.getLogger('app')
+pipeline = start_pipeline(logger, prefix='producer')
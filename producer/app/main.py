@@ -1,24 +1,74 @@
-from fastapi import FastAPI
-from dotenv import load_dotenv
-load_dotenv()
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 
 from app.user.api import user_router
 from app.order.api import order_router
 from app.auth.api import auth_router
-from app.database import Base, engine
+from app.health import health_router, warm_up
+from app.admission import AdmissionMiddleware
+from app.profiler import ProfilerMiddleware, profiler_router
+from app.database import dispose_engines
+from app.cache import cache_stats
+from app.metrics import CacheCollector, MetricsMiddleware
+from app.rmq_connector import cache_invalidator
+from app.auth.password import password_hasher, PasswordHasherBusy
 from . import logger
 
-# import all model files for database recognition
-from app.user import model
-from app.order import model
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start serving without waiting on any backend.
+    The database schema is created by `python -m app.bootstrap`, connections are
+    opened in the background and /health/ready reports once they are.
+    """
+    warm_up.start()
+    # read caches stay disabled until evictions from other replicas are received
+    cache_invalidator.start()
+
+    yield
+
+    await warm_up.stop()
+    await cache_invalidator.stop()
+    await dispose_engines()
+    password_hasher.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+# the last middleware added runs first, metrics include shed requests
+# and profiles exclude the time queued by admission control
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
+REGISTRY.register(CacheCollector(cache_stats))
 
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+@app.exception_handler(PasswordHasherBusy)
+async def overloaded_handler(request: Request, exc: Exception):
+    """Reply 503 when a bounded queue refuses new work.
+    """
+    del request
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={'detail': str(exc)},
+        headers={'Retry-After': '1'},
+    )
+
 
 app.include_router(user_router)
 app.include_router(order_router)
 app.include_router(auth_router)
+app.include_router(health_router)
+app.include_router(profiler_router)
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    """Expose the process metrics in the Prometheus text format.
+    """
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
 
 logger.info('Producer initialized.')
\ No newline at end of file
@@ -0,0 +1,143 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+# seconds, from a cached lookup to a slow bcrypt round or broker confirm
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HTTP_REQUESTS = Counter(
+    'http_requests_total',
+    'HTTP requests by route template and status code.',
+    ['method', 'route', 'status'],
+)
+HTTP_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request duration by route template, until the response is fully sent.',
+    ['method', 'route'],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    'producer_stage_duration_seconds',
+    'Duration of the producer hot path stages.',
+    ['stage'],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    'producer_stage_errors_total',
+    'Producer hot path stages that raised.',
+    ['stage'],
+)
+RMQ_RECONNECTS = Counter(
+    'rmq_reconnects_total',
+    'RabbitMQ connections reopened after being lost.',
+)
+OUTBOX_RELAYED = Counter(
+    'outbox_relayed_events_total',
+    'Outbox events published and deleted by the relay.',
+)
+ADMISSION_LIMIT = Gauge(
+    'admission_limit',
+    'Concurrent requests admitted by route name.',
+    ['route'],
+)
+ADMISSION_REJECTED = Counter(
+    'admission_rejected_total',
+    'Requests shed by admission control, by route name and status code.',
+    ['route', 'status'],
+)
+
+# stage name: callbacks receiving each duration
+_stage_observers: Dict[str, List[Callable[[float], None]]] = defaultdict(list)
+
+
+def observe_stage(stage: str, callback: Callable[[float], None]):
+    """Call back with the duration of every timed run of a stage, failed ones included.
+    Callbacks run on the timing thread, which may be a threadpool worker.
+
+    Args:
+        stage (str): Stage name, e.g. db_commit
+        callback (Callable[[float], None]): Receives the duration in seconds
+    """
+    _stage_observers[stage].append(callback)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Record the duration of a stage, counting it as an error if it raises.
+    Usable around awaits, since only wall-clock time is measured.
+
+    Args:
+        stage (str): Stage name, e.g. db_commit
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_LATENCY.labels(stage).observe(duration)
+        for callback in _stage_observers.get(stage, ()):
+            callback(duration)
+
+
+class CacheCollector():
+    """Exports the counters kept by the caches themselves, read on every scrape.
+    """
+    def __init__(self, stats: Callable[[], Dict[str, dict]]):
+        """Initialize the collector.
+
+        Args:
+            stats (Callable[[], Dict[str, dict]]): Returns size, hits and misses by cache name
+        """
+        self.stats = stats
+
+    def collect(self):
+        hits = CounterMetricFamily('cache_hits', 'Cache lookups served from memory.', labels=['cache'])
+        misses = CounterMetricFamily('cache_misses', 'Cache lookups missed.', labels=['cache'])
+        size = GaugeMetricFamily('cache_entries', 'Entries currently cached.', labels=['cache'])
+        for name, stats in self.stats().items():
+            hits.add_metric([name], stats['hits'])
+            misses.add_metric([name], stats['misses'])
+            size.add_metric([name], stats['size'])
+        yield hits
+        yield misses
+        yield size
+
+
+class MetricsMiddleware():
+    """ASGI middleware timing every HTTP request by its route template.
+    Requests matching no route share a single 'unmatched' label, bounding label cardinality.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # the router stores the matched route in the scope
+            route = scope.get('route')
+            route = getattr(route, 'path', None) or 'unmatched'
+            HTTP_REQUESTS.labels(scope['method'], route, status_code).inc()
+            HTTP_LATENCY.labels(scope['method'], route).observe(time.perf_counter() - start)
@@ -1,15 +1,28 @@
-from typing import List, Annotated
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from enum import Enum
+from typing import Annotated, AsyncIterator, List
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.metrics import timed
+from app.database import get_async_db, get_async_engine
+from app.pagination import Page, page_limit, encode_cursor, decode_cursor
 from .model import Order
-from .schema import OrderSchema, CreateOrderSchema
+from .schema import OrderSchema, CreateOrderSchema, BulkOrderResultSchema, BulkOrderResponseSchema
 from app.auth.utils import get_current_active_user
-from app.user.model import User
+from app.user.schema import UserSchema
 from app import logger
-from app.rmq_connector import RMQExchangeConnector
+from app.outbox.model import OutboxEvent
+from common.codec import Event, EventType
+from common.partition import order_partition_key
+from app.cache import TTLCache, READ_CACHE_SIZE, READ_CACHE_TTL, named_cache
 
 
 order_router = APIRouter(
@@ -17,19 +30,126 @@ order_router = APIRouter(
     tags=['Order']
 )
 
-@order_router.get('/', response_model=List[OrderSchema])
-def list_orders(db: Session = Depends(get_db)):
-    """Return a list of all registered orders.
+EXPORT_COLUMNS = (Order.id, Order.details, Order.closed, Order.created_at, Order.created_by)
+EXPORT_BATCH_SIZE = 5000
+BULK_MAX_ORDERS = int(os.environ.get('ORDER_BULK_MAX', 1000))
+
+# order id -> OrderSchema
+order_cache = named_cache('order', TTLCache(max_size=READ_CACHE_SIZE, ttl=READ_CACHE_TTL))
+
+
+class ExportFormat(str, Enum):
+    ndjson = 'ndjson'
+    csv = 'csv'
+
+
+async def _export_batches(created_by: int | None, closed: bool | None) -> AsyncIterator[list]:
+    """Read orders through a server-side cursor, one batch of plain rows at a time.
+    """
+    query = select(*EXPORT_COLUMNS).order_by(Order.id)
+    if created_by is not None:
+        query = query.where(Order.created_by == created_by)
+    if closed is not None:
+        query = query.where(Order.closed == closed)
+
+    async with get_async_engine().connect() as connection:
+        result = await connection.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for batch in result.partitions():
+            yield batch
+
+
+async def _ndjson_chunks(batches: AsyncIterator[list]) -> AsyncIterator[str]:
+    async for batch in batches:
+        yield ''.join(
+            json.dumps({
+                'id': row.id,
+                'details': row.details,
+                'closed': row.closed,
+                'created_at': row.created_at.isoformat(),
+                'created_by': row.created_by,
+            }) + '\n'
+            for row in batch
+        )
+
+
+async def _csv_chunks(batches: AsyncIterator[list]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.key for column in EXPORT_COLUMNS])
+    async for batch in batches:
+        writer.writerows(
+            (row.id, row.details, row.closed, row.created_at.isoformat(), row.created_by)
+            for row in batch
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+@order_router.get('/', response_model=Page[OrderSchema])
+async def list_orders(
+    limit: Annotated[int, Depends(page_limit)],
+    cursor: str | None = None,
+    created_by: int | None = None,
+    closed: bool | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Return registered orders by creation date, one page at a time.
+
+    Args:
+        limit (int): Page size
+        cursor (str, optional): next_cursor of the previous page. Defaults to None.
+        created_by (int, optional): Only orders of this user. Defaults to None.
+        closed (bool, optional): Only closed or open orders. Defaults to None.
 
     Returns:
-        List[OrderSchema]: List of all orders
+        Page[OrderSchema]: Orders page and the cursor of the next one
     """
-    orders = db.query(Order).all()
-    return orders
+    query = select(Order).order_by(Order.created_at, Order.id)
+    if created_by is not None:
+        query = query.where(Order.created_by == created_by)
+    if closed is not None:
+        query = query.where(Order.closed == closed)
+    if cursor is not None:
+        last_created_at, last_id = decode_cursor(cursor, datetime, int)
+        query = query.where(tuple_(Order.created_at, Order.id) > (last_created_at, last_id))
+
+    orders = (await db.scalars(query.limit(limit + 1))).all()
+    if len(orders) > limit:
+        last = orders[limit - 1]
+        next_cursor = encode_cursor(last.created_at.isoformat(), last.id)
+    else:
+        next_cursor = None
+    return Page(items=orders[:limit], next_cursor=next_cursor)
+
+@order_router.get('/export')
+async def export_orders(
+    format: ExportFormat = ExportFormat.ndjson,
+    created_by: int | None = None,
+    closed: bool | None = None,
+):
+    """Stream every order as NDJSON or CSV, with constant memory usage.
+
+    Args:
+        format (ExportFormat, optional): Output format. Defaults to ndjson.
+        created_by (int, optional): Only orders of this user. Defaults to None.
+        closed (bool, optional): Only closed or open orders. Defaults to None.
+
+    Returns:
+        StreamingResponse: Orders ordered by id
+    """
+    batches = _export_batches(created_by=created_by, closed=closed)
+    if format == ExportFormat.csv:
+        return StreamingResponse(
+            _csv_chunks(batches),
+            media_type='text/csv',
+            headers={'Content-Disposition': 'attachment; filename="orders.csv"'},
+        )
+    return StreamingResponse(_ndjson_chunks(batches), media_type='application/x-ndjson')
 
 @order_router.get('/{order_id}', response_model=OrderSchema)
-def get_order(order_id: int, db: Session = Depends(get_db)):
-    """Return an order by its id.
+async def get_order(order_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Return an order by its id, querying the database only on a cache miss.
 
     Args:
         order_id (int): Order id
@@ -40,35 +160,119 @@ def get_order(order_id: int, db: Session = Depends(get_db)):
     Returns:
         OrderSchema: Order details
     """
-    order = db.query(Order).get(order_id)
+    cached = order_cache.get(order_id)
+    if cached is not None:
+        return cached
+
+    order = await db.get(Order, order_id)
     if not order:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail='Order not found',
         )
-    return order
+    cached = OrderSchema.model_validate(order, from_attributes=True)
+    order_cache.set(order_id, cached)
+    return cached
 
 @order_router.post('/', status_code=status.HTTP_204_NO_CONTENT)
-def create_order(
+async def create_order(
     body: CreateOrderSchema,
-    current_user: Annotated[User, Depends(get_current_active_user)],
-    db: Session = Depends(get_db),
+    current_user: Annotated[UserSchema, Depends(get_current_active_user)],
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Create an order.
 
     Args:
         body (CreateOrderSchema): Order details
     """
-    order = Order(details=body.details, user_id=current_user.id)
-    logger.info(f'New order created by {current_user.id}')
-
-    with RMQExchangeConnector(exchange='producer_log', exchange_type='topic') as rmq:
-        try:
-            db.add(order)
-            db.commit()
-
-            routing_key = rmq.create_queue(queue='order.info', binding_key='order.*')
-            rmq.basic_publish(routing_key=routing_key, body=f'New order created by {current_user.id}.')
-        except Exception:
-            routing_key = rmq.create_queue(queue='order.error', binding_key='order.error')
-            rmq.basic_publish(routing_key=routing_key, body=f'Order creation failed to user {current_user.id}.')
+    user_id = current_user.id
+    order = Order(details=body.details, user_id=user_id)
+    logger.info(f'New order created by {user_id}')
+
+    try:
+        db.add(order)
+        await db.flush()
+        db.add(OutboxEvent(
+            routing_key=order_partition_key(user_id),
+            event=Event.create(EventType.ORDER_CREATED, order_id=order.id, user_id=user_id, details=body.details),
+        ))
+        with timed('db_commit'):
+            await db.commit()
+    except Exception:
+        await db.rollback()
+        db.add(OutboxEvent(
+            routing_key='order.error',
+            event=Event.create(EventType.ORDER_CREATION_FAILED, user_id=user_id),
+        ))
+        await db.commit()
+
+@order_router.post('/bulk', response_model=BulkOrderResponseSchema)
+async def create_orders(
+    body: List[CreateOrderSchema],
+    current_user: Annotated[UserSchema, Depends(get_current_active_user)],
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Create several orders in a single transaction.
+    Valid orders are inserted with one multi-row INSERT, along with their events.
+
+    Args:
+        body (List[CreateOrderSchema]): Orders details
+
+    Raises:
+        HTTPException: 413
+
+    Returns:
+        BulkOrderResponseSchema: Outcome of each order, in request order
+    """
+    if len(body) > BULK_MAX_ORDERS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f'At most {BULK_MAX_ORDERS} orders per request',
+        )
+
+    results = [BulkOrderResultSchema(index=index, status='created') for index in range(len(body))]
+    accepted = []
+    for index, item in enumerate(body):
+        if len(item.details) > Order.details.type.length:
+            results[index].status = 'rejected'
+            results[index].detail = f'details longer than {Order.details.type.length} characters'
+        else:
+            accepted.append(index)
+    if not accepted:
+        return BulkOrderResponseSchema(created=0, results=results)
+
+    user_id = current_user.id
+    logger.info(f'{len(accepted)} new orders created by {user_id}')
+    try:
+        order_ids = (await db.scalars(
+            insert(Order).returning(Order.id, sort_by_parameter_order=True),
+            [{'details': body[index].details, 'created_by': user_id} for index in accepted],
+        )).all()
+        await db.execute(
+            insert(OutboxEvent),
+            [
+                OutboxEvent.values(order_partition_key(user_id), Event.create(
+                    EventType.ORDER_CREATED,
+                    order_id=order_id,
+                    user_id=user_id,
+                    details=body[index].details,
+                ))
+                for index, order_id in zip(accepted, order_ids)
+            ],
+        )
+        with timed('db_commit'):
+            await db.commit()
+    except Exception:
+        await db.rollback()
+        db.add(OutboxEvent(
+            routing_key='order.error',
+            event=Event.create(EventType.ORDER_CREATION_FAILED, user_id=user_id),
+        ))
+        await db.commit()
+        for index in accepted:
+            results[index].status = 'failed'
+        return BulkOrderResponseSchema(created=0, results=results)
+
+    for index, order_id in zip(accepted, order_ids):
+        results[index].id = order_id
+    return BulkOrderResponseSchema(created=len(order_ids), results=results)
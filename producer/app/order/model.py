@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, Column, DateTime, ForeignKey, Boolean, String, func
+from sqlalchemy import Integer, Column, DateTime, ForeignKey, Boolean, String, Index, func
 from sqlalchemy.sql import expression
 
 from app.database import Base
@@ -13,6 +13,12 @@ class Order(Base):
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     created_by = Column(Integer, ForeignKey('user.id'), nullable=False, index=True)
 
+    # keyset pagination, with and without the created_by filter
+    __table_args__ = (
+        Index('ix_order_created_at_id', 'created_at', 'id'),
+        Index('ix_order_created_by_created_at_id', 'created_by', 'created_at', 'id'),
+    )
+
     def __init__(self, details: str, user_id: int):
         self.details = details
         self.created_by = user_id
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import List, Literal
 
 from pydantic import BaseModel
 
@@ -11,3 +12,13 @@ class OrderSchema(BaseModel):
 
 class CreateOrderSchema(BaseModel):
     details: str
+
+class BulkOrderResultSchema(BaseModel):
+    index: int
+    status: Literal['created', 'rejected', 'failed']
+    id: int | None = None
+    detail: str | None = None
+
+class BulkOrderResponseSchema(BaseModel):
+    created: int
+    results: List[BulkOrderResultSchema]
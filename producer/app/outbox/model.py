@@ -0,0 +1,38 @@
+from sqlalchemy import Integer, Column, DateTime, LargeBinary, SmallInteger, String, func
+
+from app.database import Base
+from common.codec import Event
+
+
+class OutboxEvent(Base):
+    """Event waiting to be relayed to the broker.
+    Written in the same transaction as the row it describes, already encoded.
+    """
+    __tablename__ = 'outbox'
+
+    id = Column(Integer, primary_key=True)
+    routing_key = Column(String(256), nullable=False)
+    event = Column(String(64), nullable=False)
+    schema_version = Column(SmallInteger, nullable=False)
+    message_id = Column(String(32), nullable=False)
+    body = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    def __init__(self, routing_key: str, event: Event):
+        self.routing_key = routing_key
+        self.event = event.type.value
+        self.schema_version = event.schema_version
+        self.message_id = event.message_id
+        self.body = event.encode()
+
+    @staticmethod
+    def values(routing_key: str, event: Event) -> dict:
+        """Column values of an event, for bulk inserts.
+        """
+        return {
+            'routing_key': routing_key,
+            'event': event.type.value,
+            'schema_version': event.schema_version,
+            'message_id': event.message_id,
+            'body': event.encode(),
+        }
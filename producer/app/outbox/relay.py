@@ -0,0 +1,136 @@
+import asyncio
+import os
+import random
+from datetime import datetime, timezone
+
+from prometheus_client import start_http_server
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import logger
+from app.database import AsyncSessionLocal, get_async_engine
+from app.metrics import OUTBOX_RELAYED, timed
+from app.rmq_connector import AsyncRMQExchangeConnector, BufferedPublisher
+from common.codec import message_properties
+from app.rmq_connector.topology import EXCHANGE, EXCHANGE_TYPE, PRODUCER_QUEUES
+from .model import OutboxEvent
+
+
+def occurred_at(created_at: datetime) -> float:
+    """Epoch time of an outbox row's creation, so the consumer lag includes the time spent in the outbox.
+    The column has no time zone, its values are taken as UTC, the database's default.
+    """
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.timestamp()
+
+
+async def relay_batch(db: AsyncSession, publisher: BufferedPublisher, batch_size: int) -> int:
+    """Publish and delete one batch of outbox events.
+    Rows are locked with SKIP LOCKED, so overlapping relays drain disjoint batches,
+    though only a single relay keeps each user's events in order.
+    Nothing is deleted unless every message of the batch is confirmed.
+
+    Args:
+        db (AsyncSession): Database session, committed or rolled back here
+        publisher (BufferedPublisher): Publisher with confirms enabled
+        batch_size (int): Maximum number of events relayed
+
+    Returns:
+        int: Number of relayed events
+    """
+    try:
+        events = (await db.execute(
+            select(
+                OutboxEvent.id,
+                OutboxEvent.routing_key,
+                OutboxEvent.event,
+                OutboxEvent.schema_version,
+                OutboxEvent.message_id,
+                OutboxEvent.body,
+                OutboxEvent.created_at,
+            )
+            .order_by(OutboxEvent.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )).all()
+        if not events:
+            await db.rollback()
+            return 0
+
+        handles = [
+            await publisher.submit(
+                body=event.body,
+                routing_key=event.routing_key,
+                properties=message_properties(
+                    event.event, event.message_id, event.schema_version, occurred_at(event.created_at),
+                ),
+            )
+            for event in events
+        ]
+        await asyncio.gather(*handles)
+
+        await db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_([event.id for event in events])))
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    return len(events)
+
+
+async def connect(rmq: AsyncRMQExchangeConnector):
+    """Connect and declare the queues, retrying with jittered exponential backoff until the broker is up.
+    Later connection losses are handled by the connector itself.
+    """
+    delay = rmq.reconnect_min_delay
+    while True:
+        try:
+            await rmq.connect()
+            for queue, binding_key, arguments in PRODUCER_QUEUES:
+                await rmq.create_queue(queue=queue, binding_key=binding_key, arguments=arguments)
+            return
+        except Exception as exc:
+            logger.warning(f'Outbox relay waiting for RabbitMQ: {exc!r}')
+            if rmq.connection is not None and rmq.connection.is_open:
+                rmq.connection.close()
+        await asyncio.sleep(random.uniform(0, delay))
+        delay = min(delay * 2, rmq.reconnect_max_delay)
+
+
+async def run_relay():
+    """Drain the outbox forever, sleeping only while it is empty.
+    """
+    batch_size = int(os.environ.get('OUTBOX_BATCH_SIZE', 1000))
+    poll_interval = float(os.environ.get('OUTBOX_POLL_INTERVAL', 0.5))
+    confirm_timeout = float(os.environ.get('OUTBOX_CONFIRM_TIMEOUT', 5))
+
+    rmq = AsyncRMQExchangeConnector(exchange=EXCHANGE, exchange_type=EXCHANGE_TYPE, confirm=True)
+    await connect(rmq)
+    async with rmq:
+        publisher = BufferedPublisher(rmq, batch_size=batch_size, confirm_timeout=confirm_timeout, policy='block')
+        publisher.start()
+        logger.info('Outbox relay initialized.')
+
+        try:
+            while True:
+                async with AsyncSessionLocal(bind=get_async_engine()) as db:
+                    try:
+                        with timed('outbox_relay_batch'):
+                            relayed = await relay_batch(db, publisher, batch_size)
+                        OUTBOX_RELAYED.inc(relayed)
+                    except Exception as exc:
+                        logger.error(f'Outbox relay batch failed: {exc!r}')
+                        relayed = 0
+                if relayed < batch_size:
+                    await asyncio.sleep(poll_interval)
+        finally:
+            await publisher.close()
+
+
+if __name__ == '__main__':
+    start_http_server(int(os.environ.get('OUTBOX_METRICS_PORT', 9100)))
+    try:
+        asyncio.run(run_relay())
+    except KeyboardInterrupt:
+        logger.info('Outbox relay stopped.')
@@ -0,0 +1,77 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Generic, List, TypeVar
+
+from fastapi import HTTPException, Query, status
+from pydantic import BaseModel
+
+
+T = TypeVar('T')
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: str | None = None
+
+
+def page_limit(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)) -> int:
+    """Page size query parameter, usable as a FastAPI dependency.
+    """
+    return limit
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode the sort key of the last row of a page into an opaque token.
+
+    Returns:
+        str: URL safe cursor
+    """
+    raw = json.dumps(values, default=str, separators=(',', ':')).encode('UTF-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _parse(value: Any, kind: type) -> Any:
+    """Check a decoded value against the type of its sort key column.
+
+    Raises:
+        ValueError: If the value doesn't fit the type
+    """
+    if kind is int and isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if kind is datetime and isinstance(value, str):
+        moment = datetime.fromisoformat(value)
+        # the sort key columns are naive, the driver refuses to compare them with aware values
+        if moment.tzinfo is None:
+            return moment
+    raise ValueError(f'Expected {kind.__name__}, got {value!r}')
+
+
+def decode_cursor(cursor: str, *types: type) -> List[Any]:
+    """Decode a cursor created by encode_cursor.
+    Values are checked against the sort key, so a crafted cursor never reaches the query.
+
+    Args:
+        cursor (str): Opaque cursor
+        types (type): Type of each sort key column, int or datetime (from its ISO format, without offset)
+
+    Raises:
+        HTTPException: 400
+
+    Returns:
+        List[Any]: Sort key values
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError(f'Expected {len(types)} values')
+        return [_parse(value, kind) for value, kind in zip(values, types)]
+    except (binascii.Error, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Invalid cursor',
+        )
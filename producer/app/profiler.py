@@ -0,0 +1,129 @@
+import asyncio
+import hmac
+import itertools
+import os
+import threading
+from typing import Union
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from common.sampler import StackSampler, Target
+
+
+PROFILE_HEADER = b'x-profile'
+
+
+class RequestProfiler():
+    """Selects the requests to profile, and holds the stacks sampled from them.
+    Requests are profiled 1 in sample_rate, or when carrying the admin token in an X-Profile header.
+    """
+    def __init__(self, sample_rate: Union[int, None] = None, token: Union[str, None] = None):
+        """Initialize the profiler, unset arguments are read from the environment.
+
+        Args:
+            sample_rate (int, optional): Profile 1 in this many requests, 0 disables sampling.
+                Defaults to PROFILER_SAMPLE_RATE
+            token (str, optional): Admin token, profiling is never triggered by headers without it.
+                Defaults to PROFILER_TOKEN
+        """
+        self.sample_rate = int(os.environ.get('PROFILER_SAMPLE_RATE', 0) if sample_rate is None else sample_rate)
+        token = os.environ.get('PROFILER_TOKEN') if token is None else token
+        self.token = token.encode() if token else None
+        self.sampler = StackSampler()
+        self._requests = itertools.count(1)
+
+    def authorized(self, value: Union[bytes, None]) -> bool:
+        return self.token is not None and value is not None and hmac.compare_digest(value, self.token)
+
+    def selects(self, scope: Scope) -> bool:
+        """Whether to profile a request, a cheap check when profiling is off.
+        """
+        if self.sample_rate and next(self._requests) % self.sample_rate == 0:
+            return True
+        if self.token is None:
+            return False
+        return self.authorized(next((value for name, value in scope['headers'] if name == PROFILE_HEADER), None))
+
+
+request_profiler = RequestProfiler()
+
+
+class ProfilerMiddleware():
+    """ASGI middleware sampling the call stacks of the selected requests.
+    The request's task is sampled running on the event loop, where blocking calls show,
+    or at the await it's suspended on otherwise. Stacks are rooted at the route template.
+    """
+    def __init__(self, app: ASGIApp, profiler: RequestProfiler = request_profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def _profile(self, scope: Scope, receive: Receive, send: Send):
+        # stacks are collapsed from the frame below this one
+        await self.app(scope, receive, send)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or not self.profiler.selects(scope):
+            await self.app(scope, receive, send)
+            return
+
+        # set by the admission middleware, which runs first
+        route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+        target = Target(
+            f'{scope["method"]} {route}',
+            threading.get_ident(),
+            ProfilerMiddleware._profile.__code__,
+            asyncio.current_task(),
+        )
+        token = self.profiler.sampler.add(target)
+        try:
+            await self._profile(scope, receive, send)
+        finally:
+            self.profiler.sampler.remove(token)
+
+
+def require_token(x_profile: Union[str, None] = Header(default=None)):
+    """Hide the profiler from requests without the admin token.
+    """
+    if request_profiler.token is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if not request_profiler.authorized(x_profile.encode() if x_profile else None):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+
+profiler_router = APIRouter(
+    prefix='/debug/profiler',
+    tags=['Debug'],
+    dependencies=[Depends(require_token)],
+    include_in_schema=False,
+)
+
+
+@profiler_router.get('', response_class=PlainTextResponse)
+async def read_profile(route: Union[str, None] = None):
+    """Return the sampled stacks of this process in the collapsed format, e.g. for flamegraph.pl.
+    A route template, such as 'POST /user/', keeps its stacks only.
+    """
+    stacks = request_profiler.sampler.collapsed()
+    if route is not None:
+        stacks = ''.join(line for line in stacks.splitlines(keepends=True) if line.startswith(f'{route};'))
+    return PlainTextResponse(stacks, headers={
+        'X-Profile-Samples': str(request_profiler.sampler.samples),
+        'X-Profile-Dropped': str(request_profiler.sampler.dropped),
+    })
+
+
+@profiler_router.put('')
+async def configure_profile(sample_rate: int = Query(ge=0)):
+    """Profile 1 in sample_rate requests from now on, 0 stops sampling.
+    """
+    request_profiler.sample_rate = sample_rate
+    return {'sample_rate': sample_rate}
+
+
+@profiler_router.delete('', status_code=status.HTTP_204_NO_CONTENT)
+async def reset_profile():
+    """Drop the sampled stacks.
+    """
+    request_profiler.sampler.reset()
@@ -0,0 +1,321 @@
+import asyncio
+import os
+import random
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Set, Tuple, Union
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+
+from app import logger
+from app.metrics import RMQ_RECONNECTS, timed
+from common.connection import connection_factory
+from .connector import connection_parameters
+
+
+class PublishNackError(Exception):
+    """The broker refused to take responsibility for a published message."""
+
+
+class AsyncRMQExchangeConnector():
+    """Asyncio RabbitMQ Single Exchange Connector.
+    Wraps pika's callback based AsyncioConnection into awaitables,
+    keeping one connection and channel on the running event loop.
+    Once connected, a lost connection is reopened in the background with jittered
+    exponential backoff, and publishes fail fast until it is.
+    """
+    def __init__(self, exchange: str = '', exchange_type: str = 'fanout', confirm: bool = False):
+        """Initialize exchange parameters, the connection is opened by connect().
+
+        Args:
+            exchange (str, optional): Exchange name. Defaults to ''.
+            exchange_type (str, optional): Exchange type. Defaults to 'fanout'.
+                Accepts [fanout, direct, topic], 'headers' won't work
+            confirm (bool, optional): Enable publisher confirms. Defaults to False.
+                If True, publish returns a future resolved by the broker's ack
+        """
+        self.exchange = exchange
+        self.exchange_type = exchange_type
+        self.confirm = confirm
+        self.connection: Union[AsyncioConnection, None] = None
+        self.channel: Union[pika.channel.Channel, None] = None
+
+        self._queues: Dict[Tuple[str, Union[str, None]], str] = {}
+        self._queue_arguments: Dict[Tuple[str, Union[str, None]], Union[dict, None]] = {}
+        self._pending: Set[asyncio.Future] = set()
+        self._unconfirmed: 'OrderedDict[int, asyncio.Future]' = OrderedDict()
+        self._delivery_tag = 0
+        self._connect_lock = asyncio.Lock()
+        self._closing = False
+        self._reconnect_task: Union[asyncio.Task, None] = None
+        self.reconnect_min_delay = float(os.environ.get('PIKA_RECONNECT_MIN_DELAY', 0.5))
+        self.reconnect_max_delay = float(os.environ.get('PIKA_RECONNECT_MAX_DELAY', 30))
+
+    async def __aenter__(self) -> 'AsyncRMQExchangeConnector':
+        """Initialize the context manager connecting and creating the Exchange.
+
+        Returns:
+            AsyncRMQExchangeConnector: self
+        """
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Exit the context manager closing the connection.
+        """
+        await self.close()
+
+    @property
+    def is_open(self) -> bool:
+        """Whether both the connection and the channel are usable.
+        """
+        return (
+            self.connection is not None and self.connection.is_open
+            and self.channel is not None and self.channel.is_open
+        )
+
+    @property
+    def reconnecting(self) -> bool:
+        """Whether a lost connection is being reopened in the background.
+        """
+        return self._reconnect_task is not None and not self._reconnect_task.done()
+
+    def connect_in_background(self):
+        """Start connecting on the running event loop without waiting for it.
+        Failed attempts are retried like a lost connection, and publishes fail fast meanwhile.
+        """
+        if not self.is_open and not self.reconnecting:
+            self._closing = False
+            self._reconnect_task = asyncio.create_task(self._reconnect_forever())
+
+    def _future(self) -> asyncio.Future:
+        """Create a future that is failed if the channel closes before it resolves.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        return future
+
+    def _fail_pending(self, exception: BaseException):
+        """Propagate a connection or channel failure to every awaiting caller.
+        """
+        for future in list(self._pending):
+            if not future.done():
+                future.set_exception(exception)
+
+    def _on_connection_closed(self, connection: AsyncioConnection, exception: BaseException):
+        del connection
+        self._fail_pending(exception)
+        if not self._closing and not self.reconnecting:
+            logger.warning(f'RabbitMQ connection lost, reconnecting: {exception!r}')
+            self._reconnect_task = asyncio.create_task(self._reconnect_forever())
+
+    def _on_channel_closed(self, channel: pika.channel.Channel, exception: BaseException):
+        del channel
+        self._fail_pending(exception)
+        # reopened along with the connection, whose closing triggers the reconnection
+        if not self._closing and self.connection is not None and self.connection.is_open:
+            self.connection.close()
+
+    async def _reconnect_forever(self):
+        """Reopen the connection and redeclare the queues, sleeping a random
+        fraction of an exponentially growing delay between attempts.
+        """
+        delay = self.reconnect_min_delay
+        while not self._closing:
+            await asyncio.sleep(random.uniform(0, delay))
+            try:
+                await self.connect()
+                queues, self._queues = list(self._queues), {}
+                for queue, binding_key in queues:
+                    await self.create_queue(
+                        queue=queue, binding_key=binding_key, arguments=self._queue_arguments.get((queue, binding_key)),
+                    )
+            except Exception as exc:
+                logger.warning(f'RabbitMQ reconnection failed: {exc!r}')
+                if self.connection is not None and self.connection.is_open:
+                    self.connection.close()
+                delay = min(delay * 2, self.reconnect_max_delay)
+                continue
+
+            RMQ_RECONNECTS.inc()
+            logger.info('RabbitMQ connection reopened.')
+            return
+
+    def _on_delivery_confirmation(self, method_frame: pika.frame.Method):
+        """Resolve the futures covered by a broker ack or nack.
+        With 'multiple' set, every tag up to the received one is confirmed.
+        """
+        confirmation = method_frame.method
+        acked = isinstance(confirmation, pika.spec.Basic.Ack)
+
+        if confirmation.multiple:
+            tags = [tag for tag in self._unconfirmed if tag <= confirmation.delivery_tag]
+        else:
+            tags = [confirmation.delivery_tag]
+
+        for tag in tags:
+            future = self._unconfirmed.pop(tag, None)
+            if future is None or future.done():
+                continue
+            if acked:
+                future.set_result(True)
+            else:
+                future.set_exception(PublishNackError(f'Message {tag} nacked by the broker'))
+
+    async def _call(self, method: Callable, **kwargs) -> Any:
+        """Await a channel RPC that reports completion through a callback.
+
+        Args:
+            method (Callable): Channel method accepting a 'callback' argument
+
+        Returns:
+            Any: Frame received on completion
+        """
+        future = self._future()
+        method(callback=lambda frame: future.done() or future.set_result(frame), **kwargs)
+        return await future
+
+    async def connect(self):
+        """Open the connection and the channel, then create the Exchange.
+        Does nothing if already connected.
+        """
+        async with self._connect_lock:
+            if self.is_open:
+                return
+            self._closing = False
+
+            with timed('rmq_connect'):
+                opened = self._future()
+                self.connection = connection_factory().asyncio(
+                    connection_parameters(),
+                    on_open_callback=lambda connection: opened.done() or opened.set_result(connection),
+                    on_open_error_callback=lambda connection, exc: opened.done() or opened.set_exception(
+                        exc if isinstance(exc, BaseException) else pika.exceptions.AMQPConnectionError(exc)
+                    ),
+                    on_close_callback=self._on_connection_closed,
+                    custom_ioloop=asyncio.get_running_loop(),
+                )
+                await opened
+
+                channel_opened = self._future()
+                self.connection.channel(
+                    on_open_callback=lambda channel: channel_opened.done() or channel_opened.set_result(channel),
+                )
+                self.channel = await channel_opened
+                self.channel.add_on_close_callback(self._on_channel_closed)
+
+                if self.confirm:
+                    # delivery tags restart on every new channel
+                    self._unconfirmed.clear()
+                    self._delivery_tag = 0
+                    await self._call(
+                        self.channel.confirm_delivery,
+                        ack_nack_callback=self._on_delivery_confirmation,
+                    )
+
+                await self._call(
+                    self.channel.exchange_declare,
+                    exchange=self.exchange,
+                    exchange_type=self.exchange_type,
+                    durable=True,
+                )
+
+    async def create_queue(
+        self,
+        queue: str = '',
+        binding_key: Union[str, None] = None,
+        arguments: Union[dict, None] = None,
+    ) -> str:
+        """Declare and bind a Queue once, returning the cached name afterwards.
+
+        Args:
+            queue (str, optional): Queue's name. Defaults to '' (random)
+            binding_key (str, optional): Binding key. Defaults to None
+                If None, Queue's name is used.
+            arguments (dict, optional): Queue arguments, e.g. x-single-active-consumer. Defaults to None
+                Must match the consumer's declaration
+
+        Returns:
+            str: Queue's name
+        """
+        key = (queue, binding_key)
+        if key in self._queues:
+            return self._queues[key]
+
+        await self.connect()
+        with timed('rmq_declare'):
+            frame = await self._call(self.channel.queue_declare, queue=queue, durable=True, arguments=arguments)
+            queue_name = frame.method.queue
+
+            await self._call(
+                self.channel.queue_bind,
+                exchange=self.exchange,
+                queue=queue_name,
+                routing_key=binding_key or queue_name,
+            )
+        self._queues[key] = queue_name
+        self._queue_arguments[key] = arguments
+        return queue_name
+
+    async def publish(
+        self,
+        body: Union[str, bytes],
+        routing_key: str = '',
+        properties: Union[pika.BasicProperties, None] = None,
+    ) -> Union[asyncio.Future, None]:
+        """Publish a message to the broker, connecting if needed.
+
+        Args:
+            body (str | bytes): Message to be published
+            routing_key (str, optional): Key to route the message. Defaults to ''
+                '' to 'fanout' exchange type
+                Queue's name to 'direct' exchange type
+                Topic to 'topic' exchange type, e.g. *.error#
+            properties (pika.BasicProperties, optional): Message properties. Defaults to None
+                If None, a persistent message without content type is published.
+
+        Raises:
+            pika.exceptions.AMQPConnectionError: If the connection is being reopened
+
+        Returns:
+            asyncio.Future | None: Broker confirmation, if confirms are enabled
+        """
+        if self.reconnecting and not self.is_open:
+            raise pika.exceptions.AMQPConnectionError('RabbitMQ connection is being reopened')
+        await self.connect()
+        confirmation = None
+        if self.confirm:
+            self._delivery_tag += 1
+            confirmation = self._future()
+            self._unconfirmed[self._delivery_tag] = confirmation
+
+        self.channel.basic_publish(
+            exchange=self.exchange,
+            routing_key=routing_key,
+            body=body,
+            properties=properties or pika.BasicProperties(
+                content_type='',
+                delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+            )
+        )
+        return confirmation
+
+    async def close(self):
+        """Stop reconnecting, then close the connection and wait for the broker to acknowledge it.
+        """
+        self._closing = True
+        if self.reconnecting:
+            self._reconnect_task.cancel()
+            try:
+                await self._reconnect_task
+            except asyncio.CancelledError:
+                pass
+        if self.connection is None or self.connection.is_closed:
+            return
+
+        closed = asyncio.get_running_loop().create_future()
+        self.connection.add_on_close_callback(lambda connection, exc: closed.done() or closed.set_result(None))
+        if not self.connection.is_closing:
+            self.connection.close()
+        await closed
@@ -0,0 +1,200 @@
+import asyncio
+from enum import Enum
+from typing import List, Tuple, Union
+
+import pika
+
+from app import logger
+from app.metrics import timed
+from .aio import AsyncRMQExchangeConnector
+
+
+# body, routing key, properties and the caller's handle
+BufferedMessage = Tuple[Union[str, bytes], str, Union[pika.BasicProperties, None], asyncio.Future]
+
+
+class BackpressurePolicy(str, Enum):
+    """Behaviour of BufferedPublisher.submit when the buffer is full."""
+    BLOCK = 'block'
+    FAIL = 'fail'
+    DROP = 'drop'
+
+
+class PublishBufferFull(Exception):
+    """The send buffer is full and the backpressure policy is 'fail'."""
+
+
+class BufferedPublisher():
+    """Bounded in-memory send buffer flushed in batches with publisher confirms.
+    Callers receive a future resolved once the broker confirms their message,
+    while a background task publishes whole batches and awaits their confirms together.
+    """
+    def __init__(
+        self,
+        connector: AsyncRMQExchangeConnector,
+        max_size: int = 10000,
+        batch_size: int = 500,
+        linger_ms: float = 5,
+        confirm_timeout: float = 5,
+        policy: Union[BackpressurePolicy, str] = BackpressurePolicy.BLOCK,
+    ):
+        """Initialize the buffer.
+
+        Args:
+            connector (AsyncRMQExchangeConnector): Connector with confirms enabled
+            max_size (int, optional): Buffered messages limit. Defaults to 10000
+            batch_size (int, optional): Messages per flush. Defaults to 500
+            linger_ms (float, optional): Time waiting to fill a batch. Defaults to 5
+            confirm_timeout (float, optional): Seconds waiting for a batch's confirms. Defaults to 5
+            policy (BackpressurePolicy, optional): Full buffer behaviour. Defaults to 'block'
+        """
+        if not connector.confirm:
+            raise ValueError('BufferedPublisher requires a connector with confirms enabled')
+
+        self.connector = connector
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000
+        self.confirm_timeout = confirm_timeout
+        self.policy = BackpressurePolicy(policy)
+
+        self._queue: 'asyncio.Queue[BufferedMessage]' = asyncio.Queue(maxsize=max_size)
+        self._task: Union[asyncio.Task, None] = None
+
+    def start(self):
+        """Start the background flusher on the running event loop.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_forever())
+
+    async def close(self):
+        """Flush every buffered message, then stop the background flusher.
+        """
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def create_queue(
+        self,
+        queue: str = '',
+        binding_key: Union[str, None] = None,
+        arguments: Union[dict, None] = None,
+    ) -> str:
+        """Declare and bind a Queue through the underlying connector.
+
+        Returns:
+            str: Queue's name
+        """
+        return await self.connector.create_queue(queue=queue, binding_key=binding_key, arguments=arguments)
+
+    async def submit(
+        self,
+        body: Union[str, bytes],
+        routing_key: str = '',
+        properties: Union[pika.BasicProperties, None] = None,
+    ) -> asyncio.Future:
+        """Buffer a message for publishing, applying the backpressure policy if full.
+
+        Args:
+            body (str | bytes): Message to be published
+            routing_key (str, optional): Key to route the message. Defaults to ''
+            properties (pika.BasicProperties, optional): Message properties. Defaults to None
+
+        Raises:
+            PublishBufferFull: If the buffer is full and the policy is 'fail'
+
+        Returns:
+            asyncio.Future: Resolves True once confirmed, False if dropped
+                Fails with the publish error otherwise
+        """
+        handle = asyncio.get_running_loop().create_future()
+        handle.add_done_callback(self._log_failure)
+        item = (body, routing_key, properties, handle)
+
+        if self.policy == BackpressurePolicy.BLOCK:
+            await self._queue.put(item)
+            return handle
+
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            if self.policy == BackpressurePolicy.FAIL:
+                handle.cancel()
+                raise PublishBufferFull(f'Send buffer full ({self._queue.maxsize} messages)')
+            logger.warning(f'Send buffer full, message to {routing_key} dropped')
+            handle.set_result(False)
+        return handle
+
+    @staticmethod
+    def _log_failure(handle: asyncio.Future):
+        """Log failed publishes, so fire-and-forget callers don't lose them silently.
+        """
+        if not handle.cancelled() and handle.exception() is not None:
+            logger.error(f'Buffered publish failed: {handle.exception()!r}')
+
+    async def _next_batch(self) -> List[BufferedMessage]:
+        """Wait for a message, then gather more until the batch is full or linger expires.
+        """
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.linger
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[BufferedMessage]):
+        """Publish a batch and resolve each handle with its broker confirmation.
+        """
+        confirms: List[asyncio.Future] = []
+        try:
+            with timed('rmq_publish'):
+                for body, routing_key, properties, _ in batch:
+                    confirms.append(await self.connector.publish(body=body, routing_key=routing_key, properties=properties))
+        except Exception as exc:
+            for *_, handle in batch[len(confirms):]:
+                if not handle.done():
+                    handle.set_exception(exc)
+
+        if confirms:
+            with timed('rmq_confirm'):
+                await asyncio.wait(confirms, timeout=self.confirm_timeout)
+
+        for confirm, (*_, handle) in zip(confirms, batch):
+            if handle.done():
+                continue
+            if not confirm.done():
+                confirm.cancel()
+                handle.set_exception(asyncio.TimeoutError('Publisher confirm timed out'))
+            elif confirm.exception() is not None:
+                handle.set_exception(confirm.exception())
+            else:
+                handle.set_result(True)
+
+    async def _flush_forever(self):
+        """Background flusher loop.
+        """
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
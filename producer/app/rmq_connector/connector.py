@@ -0,0 +1,27 @@
+import os
+
+import pika
+
+
+def connection_parameters() -> pika.ConnectionParameters:
+    """Build the broker connection parameters from the environment.
+    Heartbeats detect a dead broker within two intervals, and connection attempts
+    give up after PIKA_CONNECT_TIMEOUT instead of hanging the caller.
+
+    Returns:
+        pika.ConnectionParameters: Connection parameters
+    """
+    connect_timeout = float(os.environ.get('PIKA_CONNECT_TIMEOUT', 5))
+    return pika.ConnectionParameters(
+        host=os.environ.get('PIKA_HOST', 'rabbitmq'),
+        port=os.environ.get('PIKA_PORT', 5672),
+        credentials=pika.PlainCredentials(
+            username=os.environ.get('PIKA_USER', 'fast'),
+            password=os.environ.get('PIKA_PASS', 'fast'),
+        ),
+        heartbeat=int(os.environ.get('PIKA_HEARTBEAT', 30)),
+        socket_timeout=connect_timeout,
+        stack_timeout=connect_timeout,
+        blocked_connection_timeout=float(os.environ.get('PIKA_BLOCKED_TIMEOUT', 30)),
+    )
+
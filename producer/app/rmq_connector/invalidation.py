@@ -0,0 +1,148 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Dict, Hashable, Union
+
+import pika
+
+from app import logger
+from app.cache import TTLCache, named_cache
+from common.connection import connection_factory
+from .aio import AsyncRMQExchangeConnector
+from .connector import connection_parameters
+from .topology import CACHE_EXCHANGE
+
+
+class CacheInvalidator():
+    """Keeps per-process caches coherent across replicas.
+    Writers broadcast evicted keys on a fanout exchange, and every process
+    consumes them from its own exclusive queue in a background thread.
+    Registered caches are disabled while that queue isn't consumed,
+    since evictions broadcast meanwhile would be missed.
+    """
+    def __init__(self, exchange: str = CACHE_EXCHANGE):
+        """Initialize the invalidator, no connection is opened until start().
+
+        Args:
+            exchange (str, optional): Fanout exchange name. Defaults to CACHE_EXCHANGE.
+        """
+        self.exchange = exchange
+        self.caches: Dict[str, TTLCache] = {}
+        self.publisher = AsyncRMQExchangeConnector(exchange=exchange, exchange_type='fanout')
+        self.retry_delay = float(os.environ.get('CACHE_RESUBSCRIBE_DELAY', 1))
+
+        self._thread: Union[threading.Thread, None] = None
+        self._connection: Union[pika.BlockingConnection, None] = None
+        self._channel: Union[pika.adapters.blocking_connection.BlockingChannel, None] = None
+        self._stopping = threading.Event()
+
+    def register(self, name: str, cache: TTLCache) -> TTLCache:
+        """Evict from a cache whenever its name is broadcast, disabling it until subscribed.
+
+        Args:
+            name (str): Cache name, shared by every replica
+            cache (TTLCache): Process-local cache
+
+        Returns:
+            TTLCache: The registered cache
+        """
+        cache.enabled = self.subscribed
+        self.caches[name] = cache
+        return named_cache(name, cache)
+
+    @property
+    def subscribed(self) -> bool:
+        """Whether evictions broadcast by other replicas are being received.
+        """
+        return self._connection is not None and self._connection.is_open
+
+    def _set_enabled(self, enabled: bool):
+        for cache in self.caches.values():
+            cache.clear()
+            cache.enabled = enabled
+
+    def _evict(self, name: str, *keys: Hashable):
+        cache = self.caches.get(name)
+        if cache is None:
+            return
+        for key in keys:
+            cache.invalidate(key)
+
+    def _on_message(self, channel, method, properties, body: bytes):
+        del channel, method, properties
+        try:
+            message = json.loads(body)
+            self._evict(message['cache'], *message['keys'])
+        except (ValueError, KeyError, TypeError) as exc:
+            logger.error(f'Invalid cache invalidation message {body!r}: {exc!r}')
+
+    def _subscribe_forever(self):
+        while not self._stopping.is_set():
+            try:
+                self._connection = connection_factory().blocking(connection_parameters())
+                channel = self._channel = self._connection.channel()
+                channel.exchange_declare(exchange=self.exchange, exchange_type='fanout', durable=True)
+                queue = channel.queue_declare(queue='', exclusive=True).method.queue
+                channel.queue_bind(exchange=self.exchange, queue=queue)
+                channel.basic_consume(queue=queue, on_message_callback=self._on_message, auto_ack=True)
+
+                # entries cached before subscribing may have missed evictions
+                self._set_enabled(True)
+                logger.info('Cache invalidation subscribed.')
+                channel.start_consuming()
+            except pika.exceptions.AMQPError as exc:
+                if not self._stopping.is_set():
+                    logger.warning(f'Cache invalidation unsubscribed, retrying in {self.retry_delay}s: {exc!r}')
+            finally:
+                self._set_enabled(False)
+                if self._connection is not None and self._connection.is_open:
+                    self._connection.close()
+            self._stopping.wait(self.retry_delay)
+
+    def start(self):
+        """Start consuming evictions in a background thread, and connecting their publisher.
+        """
+        if self._thread is not None:
+            return
+        self.publisher.connect_in_background()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._subscribe_forever, name='cache-invalidator', daemon=True)
+        self._thread.start()
+
+    async def invalidate(self, name: str, *keys: Hashable):
+        """Evict keys from a cache on this process, then on every other replica.
+        Never waits on a connection: while the publisher isn't connected the broadcast is skipped,
+        and failures are logged, the cache's time to live bounds staleness elsewhere.
+
+        Args:
+            name (str): Registered cache name
+            keys (Hashable): JSON serializable keys
+        """
+        self._evict(name, *keys)
+        if not self.publisher.is_open:
+            logger.warning(f'Cache invalidation of {name} not broadcast: RabbitMQ not connected')
+            return
+        try:
+            await self.publisher.publish(body=json.dumps({'cache': name, 'keys': list(keys)}))
+        except Exception as exc:
+            logger.warning(f'Cache invalidation of {name} not broadcast: {exc!r}')
+
+    async def stop(self):
+        """Stop the background thread and close both connections.
+        """
+        self._stopping.set()
+        connection, channel = self._connection, self._channel
+        if connection is not None and connection.is_open and channel is not None:
+            try:
+                # pika connections are not thread-safe, stop consuming from the consumer thread
+                connection.add_callback_threadsafe(channel.stop_consuming)
+            except pika.exceptions.AMQPError:
+                pass
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+        await self.publisher.close()
+
+
+cache_invalidator = CacheInvalidator()
@@ -0,0 +1,17 @@
+from common.partition import ORDER_PARTITIONS, PARTITION_ARGUMENTS
+
+EXCHANGE = 'producer_log'
+EXCHANGE_TYPE = 'topic'
+
+# (queue, binding_key, arguments) consumed downstream
+# 'order.*' matches no partition key, 'order.info' only receives events written before partitioning
+PRODUCER_QUEUES = (
+    ('user.info', 'user.*', None),
+    ('user.error', 'user.error', None),
+    ('order.info', 'order.*', None),
+    ('order.error', 'order.error', None),
+    *((f'order.info.{partition}', f'order.info.{partition}', PARTITION_ARGUMENTS) for partition in range(ORDER_PARTITIONS)),
+)
+
+# fanout exchange broadcasting cache evictions to every producer replica
+CACHE_EXCHANGE = 'producer_cache'
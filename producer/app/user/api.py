@@ -1,14 +1,20 @@
-from typing import List, Annotated
+from typing import Annotated
 
 from fastapi import APIRouter, HTTPException, status, Depends
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .model import User
 from .schema import UserSchema, CreateUserSchema
-from app.database import get_db
+from app.metrics import timed
+from app.database import get_async_db
+from app.pagination import Page, page_limit, encode_cursor, decode_cursor
 from app import logger
-from app.rmq_connector import RMQExchangeConnector
+from app.outbox.model import OutboxEvent
+from common.codec import Event, EventType
+from app.auth.password import password_hasher
+from app.cache import TTLCache, READ_CACHE_SIZE, READ_CACHE_TTL, named_cache
 
 
 user_router = APIRouter(
@@ -16,19 +22,36 @@ user_router = APIRouter(
     tags=['User'],
 )
 
-@user_router.get('/list', response_model=List[UserSchema])
-def list_users(db: Annotated[Session, Depends(get_db)]) -> List[UserSchema]:
-    """List all registered users.
+# user id -> UserSchema
+user_cache = named_cache('user', TTLCache(max_size=READ_CACHE_SIZE, ttl=READ_CACHE_TTL))
+
+@user_router.get('/list', response_model=Page[UserSchema])
+async def list_users(
+    db: Annotated[AsyncSession, Depends(get_async_db)],
+    limit: Annotated[int, Depends(page_limit)],
+    cursor: str | None = None,
+) -> Page[UserSchema]:
+    """List registered users by id, one page at a time.
+
+    Args:
+        limit (int): Page size
+        cursor (str, optional): next_cursor of the previous page. Defaults to None.
 
     Returns:
-        List[User]: List of all users
+        Page[UserSchema]: Users page and the cursor of the next one
     """
-    users = db.query(User).all()
-    return users
+    query = select(User).order_by(User.id)
+    if cursor is not None:
+        last_id, = decode_cursor(cursor, int)
+        query = query.where(User.id > last_id)
+
+    users = (await db.scalars(query.limit(limit + 1))).all()
+    next_cursor = encode_cursor(users[limit - 1].id) if len(users) > limit else None
+    return Page(items=users[:limit], next_cursor=next_cursor)
 
 @user_router.get('/{user_id}', response_model=UserSchema)
-def get_user(user_id: int, db: Annotated[Session, Depends(get_db)]) -> UserSchema:
-    """Return user by its id.
+async def get_user(user_id: int, db: Annotated[AsyncSession, Depends(get_async_db)]) -> UserSchema:
+    """Return user by its id, querying the database only on a cache miss.
 
     Args:
         user_id (int): User id
@@ -37,18 +60,27 @@ def get_user(user_id: int, db: Annotated[Session, Depends(get_db)]) -> UserSchem
         HTTPException: 404
 
     Returns:
-        User: User instance
+        UserSchema: User details
     """
-    user = db.query(User).get(user_id)
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail='User not found',
         )
-    return user
+    cached = UserSchema.model_validate(user, from_attributes=True)
+    user_cache.set(user_id, cached)
+    return cached
 
 @user_router.post('/', status_code=status.HTTP_204_NO_CONTENT)
-def create_user(body: CreateUserSchema, db: Annotated[Session, Depends(get_db)]) -> None:
+async def create_user(
+    body: CreateUserSchema,
+    db: Annotated[AsyncSession, Depends(get_async_db)],
+) -> None:
     """Create a new user.
 
     Args:
@@ -60,22 +92,28 @@ def create_user(body: CreateUserSchema, db: Annotated[Session, Depends(get_db)])
     user = User(
         name=body.name,
         email=body.email,
-        password=body.password,
+        password_hash=await password_hasher.hash_async(body.password),
     )
     logger.info(f'New user created: {body.email}')
 
-    with RMQExchangeConnector(exchange='producer_log', exchange_type='topic') as rmq:
-        db.add(user)
-        try:
-            db.commit()
-
-            routing_key = rmq.create_queue(queue='user.info', binding_key='user.*')
-            rmq.basic_publish(routing_key=routing_key, body=f'User {body.email} created.')
-        except IntegrityError:
-            routing_key = rmq.create_queue(queue='user.error', binding_key='user.error')
-            rmq.basic_publish(routing_key=routing_key, body=f'User creation failed to email {body.email}.')
-
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail='Email already registered',
-            )
+    db.add(user)
+    try:
+        await db.flush()
+        db.add(OutboxEvent(
+            routing_key='user.info',
+            event=Event.create(EventType.USER_CREATED, user_id=user.id, email=user.email),
+        ))
+        with timed('db_commit'):
+            await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        db.add(OutboxEvent(
+            routing_key='user.error',
+            event=Event.create(EventType.USER_CREATION_FAILED, email=body.email),
+        ))
+        await db.commit()
+
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Email already registered',
+        )
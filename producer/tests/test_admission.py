@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from app.admission import AdaptiveLimit, RouteLimiter, parse_limits
+
+
+def test_slow_samples_decrease_the_limit_once_per_cooldown():
+    limit = AdaptiveLimit(maximum=8, target=0.1, cooldown=60)
+    limit.observe(0.5)
+    limit.observe(0.5)
+    assert limit.value == 6
+    assert limit.saturated
+
+
+def test_limit_decreases_down_to_its_minimum():
+    limit = AdaptiveLimit(maximum=8, target=0.1, minimum=2, cooldown=0)
+    for value in (6, 4, 3, 2, 2):
+        limit.observe(0.5)
+        assert limit.value == value
+
+
+def test_a_full_limit_of_fast_samples_adds_one_back():
+    limit = AdaptiveLimit(maximum=8, target=0.1, cooldown=0)
+    limit.observe(0.5)
+    assert limit.value == 6
+
+    for _ in range(5):
+        limit.observe(0.01)
+    assert limit.value == 6
+    limit.observe(0.01)
+    assert limit.value == 7
+
+    for _ in range(7):
+        limit.observe(0.01)
+    assert limit.value == 8
+    assert not limit.saturated
+    limit.observe(0.01)
+    assert limit.value == 8
+
+
+def test_slow_sample_resets_the_fast_streak():
+    limit = AdaptiveLimit(maximum=8, target=0.1, cooldown=60)
+    limit.observe(0.5)
+    for _ in range(5):
+        limit.observe(0.01)
+    # within the cooldown, the limit stays but the streak starts over
+    limit.observe(0.5)
+    for _ in range(5):
+        limit.observe(0.01)
+    assert limit.value == 6
+
+
+@pytest.mark.parametrize('saturated, rejection', [(False, 429), (True, 503)])
+def test_requests_beyond_the_queue_are_rejected(saturated, rejection):
+    async def scenario():
+        limit = AdaptiveLimit(maximum=2, target=0.1)
+        if saturated:
+            limit.observe(0.5)
+        limiter = RouteLimiter('create_order', limit, queue_size=1, max_wait=1)
+
+        admitted = [await limiter.acquire() for _ in range(limit.value)]
+        queued = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert await limiter.acquire() == rejection
+
+        limiter.release()
+        assert await queued is None
+        return admitted, limiter.in_flight
+
+    admitted, in_flight = asyncio.run(scenario())
+    assert admitted == [None] * len(admitted)
+    assert in_flight == len(admitted)
+
+
+def test_queued_requests_time_out():
+    async def scenario():
+        limiter = RouteLimiter('export_orders', AdaptiveLimit(maximum=1, target=0.1), queue_size=4, max_wait=0.01)
+        assert await limiter.acquire() is None
+        rejection = await limiter.acquire()
+        limiter.release()
+        return rejection, limiter.in_flight
+
+    assert asyncio.run(scenario()) == (429, 0)
+
+
+def test_parse_limits():
+    assert parse_limits('') == {}
+    assert parse_limits(' create_orders=4, export_orders=2 ') == {'create_orders': 4, 'export_orders': 2}
+
+
+@pytest.mark.parametrize('spec', ['unknown=4', 'create_orders=0', 'create_orders=many', 'create_orders'])
+def test_parse_limits_rejects_invalid_overrides(spec):
+    with pytest.raises(ValueError):
+        parse_limits(spec)
@@ -0,0 +1,40 @@
+from sqlalchemy import create_engine, inspect, text
+
+from app.bootstrap import MIGRATIONS, bootstrap
+
+
+BASELINE_SCHEMA = (
+    'CREATE TABLE "user" (id INTEGER PRIMARY KEY, name VARCHAR(64), email VARCHAR(128) NOT NULL UNIQUE, '
+    'password VARCHAR(128) NOT NULL)',
+    'CREATE TABLE "order" (id INTEGER PRIMARY KEY, details VARCHAR(256), closed BOOLEAN NOT NULL, '
+    'created_at DATETIME NOT NULL, created_by INTEGER NOT NULL REFERENCES "user" (id))',
+    'CREATE INDEX ix_order_created_by ON "order" (created_by)',
+)
+
+
+def order_indexes(uri: str) -> set:
+    return {index['name'] for index in inspect(create_engine(uri)).get_indexes('order')}
+
+
+def applied(uri: str) -> list:
+    with create_engine(uri).connect() as connection:
+        return list(connection.scalars(text('SELECT name FROM schema_migration ORDER BY name')))
+
+
+def test_existing_tables_get_the_keyset_indexes(tmp_path):
+    uri = f'sqlite:///{tmp_path / "baseline.db"}'
+    with create_engine(uri).begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.execute(text(statement))
+
+    bootstrap(create_engine(uri))
+    assert {'ix_order_created_at_id', 'ix_order_created_by_created_at_id'} <= order_indexes(uri)
+    assert applied(uri) == [name for name, _ in MIGRATIONS]
+
+
+def test_new_database_is_migrated_once(tmp_path):
+    uri = f'sqlite:///{tmp_path / "new.db"}'
+    bootstrap(create_engine(uri))
+    bootstrap(create_engine(uri))
+    assert {'ix_order_created_at_id', 'ix_order_created_by_created_at_id'} <= order_indexes(uri)
+    assert applied(uri) == [name for name, _ in MIGRATIONS]
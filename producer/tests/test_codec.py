@@ -0,0 +1,53 @@
+import msgpack
+import pika
+import pytest
+
+from common.codec import CONTENT_TYPE, EVENT_FIELDS, Event, EventType, UnsupportedMessage, decode
+
+
+@pytest.mark.parametrize('event_type, data', [
+    (EventType.USER_CREATED, {'user_id': 1, 'email': 'user@mail.com'}),
+    (EventType.USER_CREATION_FAILED, {'email': 'user@mail.com'}),
+    (EventType.ORDER_CREATED, {'order_id': 2, 'user_id': 1, 'details': 'two pizzas'}),
+    (EventType.ORDER_CREATION_FAILED, {'user_id': 1}),
+])
+def test_event_round_trip(event_type, data):
+    event = Event.create(event_type, **data)
+    assert decode(event.properties(), event.encode()) == event
+
+
+def test_create_rejects_fields_outside_the_schema():
+    with pytest.raises(ValueError):
+        Event.create(EventType.USER_CREATED, user_id=1)
+    with pytest.raises(ValueError):
+        Event.create(EventType.USER_CREATION_FAILED, email='user@mail.com', name='user')
+
+
+def test_decode_dispatches_on_schema_version(monkeypatch):
+    monkeypatch.setitem(EVENT_FIELDS, (EventType.USER_CREATED, 2), ('user_id', 'name', 'email'))
+
+    current = Event(EventType.USER_CREATED, {'user_id': 1, 'name': 'user', 'email': 'user@mail.com'}, schema_version=2)
+    assert decode(current.properties(), current.encode()).data == current.data
+
+    # still written by replicas that weren't upgraded yet
+    old = Event.create(EventType.USER_CREATED, user_id=1, email='user@mail.com')
+    decoded = decode(old.properties(), old.encode())
+    assert decoded.schema_version == 1
+    assert decoded.data == {'user_id': 1, 'email': 'user@mail.com'}
+
+
+def properties(content_type: str = CONTENT_TYPE, **headers) -> pika.BasicProperties:
+    return pika.BasicProperties(content_type=content_type, headers=headers)
+
+
+@pytest.mark.parametrize('message_properties, body', [
+    (properties('application/json', event='user_created', schema_version=1), msgpack.packb([0, 1, 'user@mail.com'])),
+    (properties(event='user_deleted', schema_version=1), msgpack.packb([0, 1])),
+    (properties(event='user_created', schema_version=99), msgpack.packb([0, 1, 'user@mail.com'])),
+    (properties(event='user_created'), msgpack.packb([0, 1, 'user@mail.com'])),
+    (properties(event='user_created', schema_version=1), msgpack.packb([0, 1])),
+    (properties(event='user_created', schema_version=1), b'\xc1'),
+])
+def test_unsupported_message_is_rejected(message_properties, body):
+    with pytest.raises(UnsupportedMessage):
+        decode(message_properties, body)
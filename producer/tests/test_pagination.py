@@ -0,0 +1,39 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.pagination import decode_cursor, encode_cursor
+
+
+def crafted(*values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 1, 1, 10, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(created_at.isoformat(), 42), datetime, int) == [created_at, 42]
+    assert decode_cursor(encode_cursor(7), int) == [7]
+
+
+@pytest.mark.parametrize('cursor, types', [
+    ('not a cursor!', (int,)),
+    (crafted(), (int,)),
+    (crafted(1, 2), (int,)),
+    (crafted('x'), (int,)),
+    (crafted(1.5), (int,)),
+    (crafted(True), (int,)),
+    (crafted(None), (int,)),
+    (crafted(1, {}), (datetime, int)),
+    (crafted('yesterday', 1), (datetime, int)),
+    (crafted(1700000000, 1), (datetime, int)),
+    (crafted('2024-01-01T10:30:00', '1'), (datetime, int)),
+    (crafted('2024-01-01T10:30:00+00:00', 1), (datetime, int)),
+    (crafted('2024-01-01T10:30:00Z', 1), (datetime, int)),
+])
+def test_invalid_cursor_is_rejected(cursor, types):
+    with pytest.raises(HTTPException) as info:
+        decode_cursor(cursor, *types)
+    assert info.value.status_code == 400
@@ -0,0 +1,32 @@
+import pytest
+
+from common.partition import jump_hash, order_partition_key
+
+
+# vectors shared by the reference implementations
+@pytest.mark.parametrize('key, buckets, bucket', [
+    (1, 1, 0),
+    (42, 57, 43),
+    (0xDEAD10CC, 1, 0),
+    (0xDEAD10CC, 666, 361),
+    (256, 1024, 520),
+])
+def test_jump_hash_reference_values(key, buckets, bucket):
+    assert jump_hash(key, buckets) == bucket
+
+
+@pytest.mark.parametrize('buckets', [1, 2, 4, 7, 16])
+def test_growing_moves_keys_only_to_the_new_bucket(buckets):
+    moved = 0
+    for key in range(10000):
+        before, after = jump_hash(key, buckets), jump_hash(key, buckets + 1)
+        if before != after:
+            assert after == buckets
+            moved += 1
+    # about 1 / (n + 1) of the keys move
+    assert moved == pytest.approx(10000 / (buckets + 1), rel=0.1)
+
+
+def test_order_partition_key():
+    assert order_partition_key(42, 57) == 'order.info.43'
+    assert order_partition_key(42, 0) == 'order.info'
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.database import Base
+from app.outbox.model import OutboxEvent
+from app.outbox.relay import relay_batch
+from common.codec import Event, EventType, decode
+
+# the async sqlite driver comes with the benchmarks' requirements
+pytest.importorskip('aiosqlite')
+
+
+class Publisher():
+    """Confirms every submitted message, or fails them all."""
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.submitted = []
+
+    async def submit(self, body, routing_key='', properties=None) -> asyncio.Future:
+        self.submitted.append((routing_key, properties, body))
+        handle = asyncio.get_running_loop().create_future()
+        if self.error is None:
+            handle.set_result(True)
+        else:
+            handle.set_exception(self.error)
+        return handle
+
+
+async def relay(tmp_path, publisher: Publisher, events: int, batch_size: int):
+    engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "outbox.db"}')
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all, tables=[OutboxEvent.__table__])
+    async with AsyncSession(engine) as db:
+        db.add_all([
+            OutboxEvent('user.info', Event.create(EventType.USER_CREATED, user_id=index, email=f'{index}@mail.com'))
+            for index in range(events)
+        ])
+        await db.commit()
+
+        try:
+            relayed = await relay_batch(db, publisher, batch_size)
+        except Exception as exc:
+            relayed = exc
+        left = await db.scalar(select(func.count()).select_from(OutboxEvent))
+    await engine.dispose()
+    return relayed, left
+
+
+@pytest.mark.parametrize('events, batch_size, relayed, left', [(3, 10, 3, 0), (5, 2, 2, 3), (0, 10, 0, 0)])
+def test_confirmed_batch_is_deleted(tmp_path, events, batch_size, relayed, left):
+    publisher = Publisher()
+    assert asyncio.run(relay(tmp_path, publisher, events, batch_size)) == (relayed, left)
+
+    # published in outbox order, with the event's properties
+    decoded = [decode(properties, body) for _, properties, body in publisher.submitted]
+    assert [event.data['user_id'] for event in decoded] == list(range(relayed))
+    assert all(routing_key == 'user.info' for routing_key, _, _ in publisher.submitted)
+
+
+def test_unconfirmed_batch_is_kept(tmp_path):
+    error = RuntimeError('nacked')
+    publisher = Publisher(error)
+    assert asyncio.run(relay(tmp_path, publisher, 3, 10)) == (error, 3)
+    assert len(publisher.submitted) == 3